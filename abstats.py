@@ -0,0 +1,298 @@
+# abstats.py — статистика A/B-тестов по поюзерным данным (NumPy): z-тест, Wald CI, SRM, t-тест,
+# bootstrap/permutation порциями в пуле процессов
+
+import hashlib
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import special
+
+# Сколько элементов (выборок значений) допускаем в одной порции ресемплинга: память ~ 8 байт × MAX_CELLS
+MAX_CELLS = 1 << 24
+
+
+# ===========================
+# Данные
+# ===========================
+def load(path) -> pd.DataFrame:
+    """Поюзерная таблица из CSV или Parquet: колонка group (A/B) + метрики."""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+@lru_cache(maxsize=32)
+def _hash_file(path: str, mtime_ns: int, size: int) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def dataset_hash(path) -> str:
+    """sha256 содержимого; сам файл перечитывается только если сменились mtime/размер."""
+    st = os.stat(path)
+    return _hash_file(str(path), st.st_mtime_ns, st.st_size)
+
+
+def split(df: pd.DataFrame, metric: str, groups=("A", "B")) -> tuple:
+    """Значения metric по группам; пропуски (NaN) отбрасываются, иначе среднее и p-value станут NaN."""
+    g = df["group"].astype(str).to_numpy()
+    x = df[metric].to_numpy(dtype=np.float64)
+    ok = ~np.isnan(x)
+    return x[ok & (g == groups[0])], x[ok & (g == groups[1])]
+
+
+# ===========================
+# Классические критерии
+# ===========================
+def _norm_sf(z: float) -> float:
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def _norm_ppf(q: float) -> float:
+    return float(special.ndtri(q))
+
+
+def two_proportion_ztest(x_a: int, n_a: int, x_b: int, n_b: int) -> tuple:
+    """z-тест двух долей (пулированная дисперсия), двусторонний. -> (z, p)"""
+    p_pool = (x_a + x_b) / (n_a + n_b)
+    se = math.sqrt(p_pool * (1 - p_pool) * (1 / n_a + 1 / n_b))
+    z = (x_b / n_b - x_a / n_a) / se if se else 0.0
+    return z, 2 * _norm_sf(abs(z))
+
+
+def wald_ci(x_a: int, n_a: int, x_b: int, n_b: int, alpha: float = 0.05) -> tuple:
+    """Непулированный Wald-интервал для p_B − p_A."""
+    pa, pb = x_a / n_a, x_b / n_b
+    se = math.sqrt(pa * (1 - pa) / n_a + pb * (1 - pb) / n_b)
+    z = _norm_ppf(1 - alpha / 2)
+    d = pb - pa
+    return d - z * se, d + z * se
+
+
+def srm_chisq(n_a: int, n_b: int, expected=(0.5, 0.5)) -> tuple:
+    """Sample ratio mismatch: χ²(1) против ожидаемого сплита. -> (chi2, p)"""
+    n = n_a + n_b
+    obs = np.array([n_a, n_b], dtype=np.float64)
+    exp = np.asarray(expected, dtype=np.float64) * n
+    chi2 = float(((obs - exp) ** 2 / exp).sum())
+    return chi2, float(special.chdtrc(1, chi2))
+
+
+def welch_ttest(a: np.ndarray, b: np.ndarray) -> tuple:
+    """t-тест Уэлча (B − A), двусторонний. -> (t, df, p)"""
+    va, vb = a.var(ddof=1) / a.size, b.var(ddof=1) / b.size
+    t = (b.mean() - a.mean()) / math.sqrt(va + vb)
+    df = (va + vb) ** 2 / (va ** 2 / (a.size - 1) + vb ** 2 / (b.size - 1))
+    return float(t), float(df), float(2 * special.stdtr(df, -abs(t)))
+
+
+# ===========================
+# Ресемплинг (порциями, в пуле процессов)
+# ===========================
+# Значения групп живут в воркере (initializer), в задачи уходят только размер порции и seed
+_WORKER = {}
+
+
+def _init_worker(a: np.ndarray, b: np.ndarray):
+    _WORKER["a"], _WORKER["b"] = a, b
+    _WORKER["nz"] = (a[a != 0], b[b != 0])
+    _WORKER["pooled_nz"] = np.concatenate(_WORKER["nz"])
+
+
+def _boot_means(x_size: int, nz: np.ndarray, k: int, rng) -> np.ndarray:
+    """
+    k бутстреп-средних выборки размера x_size, у которой ненулевые значения — nz.
+    Нули в сумму не входят, поэтому достаточно разыграть, сколько раз попались
+    ненулевые (Binomial), и просуммировать столько случайных из nz: для разреженных
+    метрик (выручка при CR 2%) это в десятки раз меньше работы, чем k × x_size.
+    """
+    if nz.size == 0:
+        return np.zeros(k)
+    m = rng.binomial(x_size, nz.size / x_size, size=k)
+    if np.all(nz == nz[0]):            # бинарная метрика: сумма = m × значение
+        return m * nz[0] / x_size
+    picks = nz[rng.integers(0, nz.size, size=int(m.sum()))]
+    sums = np.zeros(k)
+    nonempty = m > 0
+    starts = np.concatenate(([0], np.cumsum(m)[:-1]))[nonempty]
+    sums[nonempty] = np.add.reduceat(picks, starts) if picks.size else 0.0
+    return sums / x_size
+
+
+def _boot_chunk(k: int, seed) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    a, b = _WORKER["a"], _WORKER["b"]
+    nz_a, nz_b = _WORKER["nz"]
+    return _boot_means(b.size, nz_b, k, rng) - _boot_means(a.size, nz_a, k, rng)
+
+
+def _perm_chunk(k: int, seed) -> np.ndarray:
+    """Разности средних (B − A) при случайной перестановке меток групп."""
+    rng = np.random.default_rng(seed)
+    a, b = _WORKER["a"], _WORKER["b"]
+    nz = _WORKER["pooled_nz"]
+    n = a.size + b.size
+    total = nz.sum()
+    # Сколько ненулевых попало в A при перестановке — гипергеометрическое
+    h = rng.hypergeometric(nz.size, n - nz.size, a.size, size=k)
+    if nz.size == 0:
+        sum_a = np.zeros(k)
+    elif np.all(nz == nz[0]):
+        sum_a = h * nz[0]
+    else:
+        # Случайное подмножество размера h — первые h значений построчно перемешанной копии
+        shuffled = rng.permuted(np.broadcast_to(nz, (k, nz.size)), axis=1)
+        csum = np.cumsum(shuffled, axis=1, out=shuffled)
+        sum_a = np.where(h > 0, csum[np.arange(k), np.maximum(h, 1) - 1], 0.0)
+    return (total - sum_a) / b.size - sum_a / a.size
+
+
+def _chunks(n_resamples: int, cells_per_resample: int) -> list:
+    k = max(1, MAX_CELLS // max(1, cells_per_resample))
+    return [min(k, n_resamples - i) for i in range(0, n_resamples, k)]
+
+
+def _mp_context():
+    """
+    forkserver (spawn там, где его нет): fork из многопоточного процесса Streamlit
+    копирует чужие захваченные блокировки, и воркер может зависнуть навсегда.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _run(fn, a, b, n_resamples: int, cells: int, workers: int, seed) -> np.ndarray:
+    sizes = _chunks(n_resamples, cells)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if workers <= 1 or len(sizes) == 1:
+        _init_worker(a, b)
+        return np.concatenate([fn(k, s) for k, s in zip(sizes, seeds)])
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context(),
+                             initializer=_init_worker, initargs=(a, b)) as ex:
+        return np.concatenate(list(ex.map(fn, sizes, seeds)))
+
+
+def bootstrap_diff_ci(a: np.ndarray, b: np.ndarray, *, n_resamples: int = 10_000, alpha: float = 0.05,
+                      workers: int = None, seed=None) -> tuple:
+    """Перцентильный бутстреп-интервал для mean(B) − mean(A)."""
+    cells = int(np.count_nonzero(a) + np.count_nonzero(b))
+    diffs = _run(_boot_chunk, a, b, n_resamples, cells, workers or os.cpu_count() or 1, seed)
+    lo, hi = np.quantile(diffs, [alpha / 2, 1 - alpha / 2])
+    return float(lo), float(hi)
+
+
+def permutation_pvalue(a: np.ndarray, b: np.ndarray, *, n_resamples: int = 10_000,
+                       workers: int = None, seed=None) -> float:
+    """Двусторонний перестановочный p-value для разности средних."""
+    nz = int(np.count_nonzero(a) + np.count_nonzero(b))
+    binary = nz == 0 or np.unique(np.concatenate([a[a != 0], b[b != 0]])).size == 1
+    diffs = _run(_perm_chunk, a, b, n_resamples, 1 if binary else nz, workers or os.cpu_count() or 1, seed)
+    observed = abs(b.mean() - a.mean())
+    return float((np.count_nonzero(np.abs(diffs) >= observed - 1e-12) + 1) / (n_resamples + 1))
+
+
+# ===========================
+# Отчёты для страницы «A/B-тесты»
+# ===========================
+def proportion_report(df: pd.DataFrame, metric: str, alpha: float = 0.05) -> dict:
+    a, b = split(df, metric)
+    x_a, x_b = int(a.sum()), int(b.sum())
+    z, p = two_proportion_ztest(x_a, a.size, x_b, b.size)
+    lo, hi = wald_ci(x_a, a.size, x_b, b.size, alpha)
+    pa, pb = x_a / a.size, x_b / b.size
+    return {"n_a": a.size, "n_b": b.size, "p_a": pa, "p_b": pb, "abs_diff": pb - pa,
+            "rel_uplift": (pb - pa) / pa if pa else float("nan"), "z": z, "p_value": p,
+            "ci_low": lo, "ci_high": hi, "alpha": alpha}
+
+
+def mean_report(df: pd.DataFrame, metric: str, alpha: float = 0.05, *, n_resamples: int = 0,
+                workers: int = None, seed: int = 0) -> dict:
+    a, b = split(df, metric)
+    t, dof, p = welch_ttest(a, b)
+    out = {"mean_a": float(a.mean()), "mean_b": float(b.mean()), "t": t, "df": dof, "p_value": p, "alpha": alpha}
+    if n_resamples:
+        out["boot_ci"] = bootstrap_diff_ci(a, b, n_resamples=n_resamples, alpha=alpha, workers=workers, seed=seed)
+        out["perm_p"] = permutation_pvalue(a, b, n_resamples=n_resamples, workers=workers, seed=seed + 1)
+    return out
+
+
+def streaming_report(df: pd.DataFrame, *, alpha: float = 0.01) -> dict:
+    """Стриминг: primary started (0/1), guardrails ttfp (t-тест) и crashed (z-тест), SRM 50/50."""
+    a, b = split(df, "started")
+    ttfp = welch_ttest(*split(df, "ttfp")) if "ttfp" in df else None
+    crash = proportion_report(df, "crashed") if "crashed" in df else None
+    return {
+        "primary": proportion_report(df, "started", alpha),
+        "srm_p": srm_chisq(a.size, b.size)[1],
+        "ttfp_p": ttfp[2] if ttfp else None,
+        "ttfp_t": ttfp[0] if ttfp else None,     # > 0 — TTFP в B больше (хуже)
+        "crash_p": crash["p_value"] if crash else None,
+        "crash_z": crash["z"] if crash else None,   # > 0 — крэшей в B больше
+    }
+
+
+def payment_report(df: pd.DataFrame, *, alpha: float = 0.05, n_resamples: int = 10_000,
+                   workers: int = None) -> dict:
+    """Платёжная механика: CR (z-тест) и ARPU (t-тест Уэлча + bootstrap CI + permutation p)."""
+    return {
+        "cr": proportion_report(df, "converted", alpha),
+        "arpu": mean_report(df, "revenue", alpha, n_resamples=n_resamples, workers=workers),
+    }
+
+
+# ===========================
+# Вердикты (по тем же отчётам; NaN в p-value — всегда «не подтверждено»)
+# ===========================
+SRM_ALPHA = 0.001   # общепринятый порог SRM-чека: строже α эксперимента, чтобы не ловить шум
+
+
+def _degraded(p, stat, alpha: float) -> bool:
+    """Guardrail значимо ухудшился; stat None — направление неизвестно, значимость считаем ухудшением."""
+    return p is not None and (math.isnan(p) or p < alpha and (stat is None or stat > 0))
+
+
+def streaming_verdict(rep: dict, *, mde: float = 0.05) -> tuple:
+    """
+    Критерии дизайна: primary p < α, нижняя граница ДИ > 0, uplift ≥ mde, guardrails
+    (TTFP, crash) без значимой деградации, нет SRM. -> (успех, [причины отказа]).
+    """
+    prim = rep["primary"]
+    alpha = prim["alpha"]
+    fails = []
+    if not prim["p_value"] < alpha:
+        fails.append(f"primary p = {prim['p_value']:.3g} ≥ α = {alpha}")
+    if not prim["ci_low"] > 0:
+        fails.append("ДИ разницы задевает 0")
+    if not prim["rel_uplift"] >= mde:
+        fails.append(f"uplift {prim['rel_uplift']:.2%} < MDE {mde:.0%}")
+    if _degraded(rep.get("ttfp_p"), rep.get("ttfp_t"), alpha):
+        fails.append("guardrail TTFP ухудшился")
+    if _degraded(rep.get("crash_p"), rep.get("crash_z"), alpha):
+        fails.append("guardrail Crash ухудшился")
+    if not rep["srm_p"] >= SRM_ALPHA:
+        fails.append(f"SRM p = {rep['srm_p']:.2g}")
+    return not fails, fails
+
+
+def payment_verdict(rep: dict) -> tuple:
+    """ARPU в B значимо выше (t-тест, и bootstrap ДИ, если есть, выше 0), CR значимо не упал."""
+    arpu, cr = rep["arpu"], rep["cr"]
+    alpha = arpu["alpha"]
+    fails = []
+    if not (arpu["p_value"] < alpha and arpu["mean_b"] > arpu["mean_a"]):
+        fails.append(f"ARPU: нет значимого роста (p = {arpu['p_value']:.2g})")
+    if "boot_ci" in arpu and not arpu["boot_ci"][0] > 0:
+        fails.append("bootstrap ДИ ARPU задевает 0")
+    if _degraded(cr.get("p_value"), -cr["abs_diff"], cr.get("alpha", alpha)):
+        fails.append("CR значимо упал")
+    return not fails, fails
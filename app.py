@@ -8,34 +8,91 @@ st.set_page_config(
     layout="wide",
 )
 
+import atexit
+import json
+import tempfile
+import threading
 import time
 import uuid
 from datetime import datetime, timezone
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
 from pathlib import Path
 from urllib.parse import quote_plus, unquote_plus
 
+import plotly.express as px
 import streamlit.components.v1 as components
-from supabase import create_client
-from streamlit_cookies_manager import EncryptedCookieManager
+from streamlit import runtime
+
+import abstats
+from images import MIME, ImageVariants
+from resources import SupabasePool
+from site_analytics import SiteAnalytics
+from spool import Spool
+from storage import DuplicateVote, SQLiteStorage, Storage, SupabaseStorage
+from telemetry import EventWriter, Heartbeat
+from tracing import Tracer
+from votes import VoteTally
 
 # ===========================
-# Supabase client (URL/KEY из st.secrets)
+# Трассировка (TRACING=true в secrets): спаны на вызовы хранилища, страницы и весь rerun
 # ===========================
+@st.cache_resource
+def get_tracer() -> Tracer:
+    tracer = Tracer(enabled=bool(st.secrets.get("TRACING", False)))
+    trace_file = st.secrets.get("TRACE_FILE")
+    if tracer.enabled and trace_file:
+        atexit.register(tracer.export, trace_file)
+    return tracer
+
+tracer = get_tracer()
+_rerun_span = tracer.start("rerun")
+
+# ===========================
+# Хранилище: Supabase (URL/KEY из st.secrets) или локальный SQLite (STORAGE_BACKEND="sqlite")
+# ===========================
+STORAGE_BACKEND = st.secrets.get("STORAGE_BACKEND", "supabase")
 SB_URL = st.secrets.get("SUPABASE_URL")
 SB_KEY = st.secrets.get("SUPABASE_KEY")
-if not SB_URL or not SB_KEY:
+if STORAGE_BACKEND == "supabase" and (not SB_URL or not SB_KEY):
     st.error("Нет секретов SUPABASE_URL / SUPABASE_KEY. Задай их в Settings → Secrets.")
     st.stop()
-sb = create_client(SB_URL, SB_KEY)
+
+@st.cache_resource
+def get_supabase_pool() -> SupabasePool:
+    """Один пул на процесс, не на каждый rerun."""
+    return SupabasePool(
+        SB_URL, SB_KEY,
+        max_connections=int(st.secrets.get("SUPABASE_MAX_CONNECTIONS", 20)),
+        max_keepalive=int(st.secrets.get("SUPABASE_MAX_KEEPALIVE", 10)),
+        timeout=float(st.secrets.get("SUPABASE_TIMEOUT", 10.0)),
+        health_interval=float(st.secrets.get("SUPABASE_HEALTH_INTERVAL", 60.0)),
+    )
+
+@st.cache_resource
+def get_storage() -> Storage:
+    if STORAGE_BACKEND == "sqlite":
+        storage = SQLiteStorage(st.secrets.get("SQLITE_PATH", "site_analytics.db"))
+    else:
+        storage = SupabaseStorage(get_supabase_pool())
+    return get_tracer().wrap(storage, "db")   # без TRACING — сам объект, без прокси
+
+db = get_storage()
 
 # ===========================
 # Cookies: персистентный visitor_id (для 1-user-1-vote и сессий)
 # ===========================
+# Менеджер куки нужен только пока visitor_id не попал в session_state: дальше
+# не пересоздаём его (и не гоняем дорогой вывод ключа шифрования) на каждом rerun.
 COOKIE_PASSWORD = st.secrets.get("COOKIE_PASSWORD", "dev-only-unsafe")
-cookies = EncryptedCookieManager(prefix="msp_", password=COOKIE_PASSWORD)
-if not cookies.ready():
-    st.stop()
+if "visitor_id" not in st.session_state:
+    # Импорт здесь: streamlit-cookies-manager 0.2 ещё зовёт st.cache, которого нет в свежих Streamlit,
+    # и не должен ронять rerun'ы, где visitor_id уже известен
+    from streamlit_cookies_manager import EncryptedCookieManager
+    cookies = EncryptedCookieManager(prefix="msp_", password=COOKIE_PASSWORD)
+    if not cookies.ready():
+        st.stop()
 
 def get_or_set_visitor_id() -> str:
     vid = cookies.get("visitor_id")
@@ -50,65 +107,184 @@ def get_or_set_visitor_id() -> str:
 # ===========================
 
 # --- Votes ---
-def add_vote(choice: str) -> bool:
+def add_vote(choice: str) -> str:
     """
-    Пишем голос с voter_id из cookie. Возвращает True если голос учтён,
-    False — если пользователь уже голосовал (уникальный индекс сработал).
+    Пишем голос с voter_id из cookie. Возвращает:
+    "ok" — голос учтён; "duplicate" — пользователь уже голосовал (уникальный индекс);
+    "queued" — база недоступна, голос лежит в локальном журнале и будет дослан.
     """
     try:
-        sb.table("votes").insert({"choice": choice, "voter_id": st.session_state.visitor_id}).execute()
-        return True
+        db.add_vote(st.session_state.visitor_id, choice)
+        status = "ok"
+    except DuplicateVote:
+        st.session_state["has_voted"] = True
+        return "duplicate"
     except Exception:
-        return False
+        # транзиентная ошибка — досылаем в фоне
+        get_event_writer().submit("votes", {"choice": choice, "voter_id": st.session_state.visitor_id})
+        status = "queued"
+    get_vote_tally().bump(choice)
+    st.session_state["has_voted"] = True
+    return status
 
 def has_voted() -> bool:
-    r = sb.table("votes").select("id").eq("voter_id", st.session_state.visitor_id).limit(1).execute()
-    return bool(r.data)
+    # Ответ кэшируется в session_state: для посетителя он меняется только через add_vote
+    if "has_voted" not in st.session_state:
+        try:
+            st.session_state["has_voted"] = db.has_voted(st.session_state.visitor_id)
+        except Exception:
+            db.mark_unhealthy()
+            return False   # не кэшируем: спросим снова на следующем rerun; повторный голос отсечёт уникальный индекс
+    return st.session_state["has_voted"]
+
+@st.cache_resource
+def get_vote_tally() -> VoteTally:
+    return VoteTally(db.vote_counts, ttl=float(st.secrets.get("VOTES_TTL", 60.0)))
 
 def get_counts():
-    likes = sb.table("votes").select("id", count="exact", head=True).eq("choice", "like").execute().count or 0
-    dislikes = sb.table("votes").select("id", count="exact", head=True).eq("choice", "dislike").execute().count or 0
-    return likes, dislikes
+    # При сбое VoteTally сам отдаёт прошлые счётчики; ошибка — только если их ещё не было
+    try:
+        return get_vote_tally().counts()
+    except Exception:
+        db.mark_unhealthy()
+        return 0, 0
 
 # --- Analytics (sessions / events / durations) ---
-def ensure_session():
+def ensure_session(register: bool = True):
     # visitor_id — из куки
     if "visitor_id" not in st.session_state:
         st.session_state.visitor_id = get_or_set_visitor_id()
     if "session_id" not in st.session_state:
         st.session_state.session_id = str(uuid.uuid4())
-        sb.table("sessions").upsert(
-            {"visitor_id": st.session_state.visitor_id, "session_id": st.session_state.session_id},
-            on_conflict="session_id"
-        ).execute()
+        if not register:
+            return   # сессию заведёт db.bootstrap (см. bootstrap_page)
+        get_event_writer().submit("sessions.upsert", {
+            "visitor_id": st.session_state.visitor_id, "session_id": st.session_state.session_id,
+        })
 
 def touch_session():
-    sb.table("sessions").update({"last_seen": datetime.now(timezone.utc).isoformat()}) \
-      .eq("session_id", st.session_state.session_id).execute()
+    # Дёшево: реальный UPDATE не чаще раза в HEARTBEAT_INTERVAL на сессию, пачкой
+    get_heartbeat().touch(st.session_state.session_id, datetime.now(timezone.utc).isoformat())
+
+# --- Фоновая запись: всё уходит через локальный журнал (spool.py), ререндер не ждёт базу ---
+# Порядок видов операций внутри пачки: сессия раньше её событий, голосов и heartbeat'ов
+WRITE_KINDS_ORDER = ("sessions.upsert", "votes", "events", "durations", "sessions.touch")
+
+def _write_batch(kind: str, rows: list):
+    try:
+        db.write_batch(kind, rows)
+    except Exception:
+        db.mark_unhealthy()   # пусть health-check проверит соединение досрочно
+        raise
+
+@st.cache_resource
+def get_event_writer():
+    """
+    Один писатель на процесс (общий для всех сессий). По умолчанию — дисковый
+    журнал Spool; SPOOL_PATH="" переключает на чисто in-memory EventWriter.
+    """
+    spool_path = st.secrets.get("SPOOL_PATH", str(Path(tempfile.gettempdir()) / "site_portfolio_spool.db"))
+    if spool_path:
+        return Spool(
+            spool_path, _write_batch,
+            kinds_order=WRITE_KINDS_ORDER,
+            batch_size=int(st.secrets.get("EVENTS_BATCH_SIZE", 200)),
+            max_backoff=float(st.secrets.get("SPOOL_MAX_BACKOFF", 60.0)),
+        )
+    return EventWriter(
+        _write_batch,
+        batch_size=int(st.secrets.get("EVENTS_BATCH_SIZE", 50)),
+        flush_interval=float(st.secrets.get("EVENTS_FLUSH_INTERVAL", 2.0)),
+        max_queue=int(st.secrets.get("EVENTS_MAX_QUEUE", 10_000)),
+    )
+
+@st.cache_resource
+def get_heartbeat() -> Heartbeat:
+    writer = get_event_writer()
+    return Heartbeat(
+        lambda sid, ts: writer.submit("sessions.touch", {"session_id": sid, "last_seen": ts}),
+        interval=float(st.secrets.get("HEARTBEAT_INTERVAL", 30.0)),
+    )
 
 def log_event(page: str, event_type: str, meta: str = None):
-    sb.table("events").insert({
+    get_event_writer().submit("events", {
         "visitor_id": st.session_state.visitor_id,
         "session_id": st.session_state.session_id,
-        "page": page, "event_type": event_type, "meta": meta
-    }).execute()
+        "page": page, "event_type": event_type, "meta": meta,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
 
 def add_time(page: str, seconds: int):
-    # upsert по (session_id, page)
-    existing = sb.table("durations").select("seconds") \
-        .eq("session_id", st.session_state.session_id).eq("page", page).execute()
-    if existing.data:
-        cur = existing.data[0].get("seconds", 0) or 0
-        sb.table("durations").update({"seconds": cur + int(seconds)}) \
-          .eq("session_id", st.session_state.session_id).eq("page", page).execute()
-    else:
-        sb.table("durations").insert({
-            "session_id": st.session_state.session_id, "page": page, "seconds": int(seconds)
-        }).execute()
-
-def start_page_timer(current_page: str):
-    """Фиксируем переходы и логируем page_view."""
-    ensure_session(); touch_session()
+    """
+    Каждый переход сразу уходит фоновому писателю: он сам копит пачку, а add_durations
+    суммирует строки одной (session_id, page). В session_state ничего не ждёт —
+    закрытая вкладка не уносит с собой накопленные секунды.
+    """
+    if seconds <= 0:
+        return
+    get_event_writer().submit("durations", {"session_id": st.session_state.session_id, "page": page,
+                                            "seconds": int(seconds)})
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_page_durations() -> dict:
+    """Суммарные секунды по страницам из агрегата page_durations (sql/page_durations.sql)."""
+    return db.page_durations()
+
+def page_durations() -> dict:
+    # Первая отрисовка после bootstrap_page берёт rollup из его ответа, без отдельного запроса
+    seeded = st.session_state.pop("_boot_durations", None)
+    if seeded is None:
+        try:
+            seeded = get_page_durations()
+        except Exception:
+            db.mark_unhealthy()
+            return st.session_state.get("_last_durations", {})   # последнее удачное чтение
+    st.session_state["_last_durations"] = seeded
+    return seeded
+
+# --- Первый заход на страницу в сессии: всё нужное для отрисовки за один round trip ---
+@st.cache_resource
+def get_io_pool() -> ThreadPoolExecutor:
+    """Пул для независимых чтений, которые идут параллельно с основным запросом страницы."""
+    return ThreadPoolExecutor(max_workers=int(st.secrets.get("IO_WORKERS", 4)), thread_name_prefix="io")
+
+def bootstrap_page(page: str, log_view: bool):
+    """
+    Upsert сессии, heartbeat и page_view — одним вызовом db.bootstrap (sql/bootstrap.sql);
+    его ответ засевает счётчики голосов, has_voted и время на страницах. Агрегаты
+    сайта — независимое чтение — грузятся параллельно в пуле.
+    """
+    st.session_state["_bootstrapped"] = True
+    now = datetime.now(timezone.utc).isoformat()
+    session = {"visitor_id": st.session_state.visitor_id, "session_id": st.session_state.session_id}
+    event = None
+    if log_view:
+        event = dict(session, page=page, event_type="page_view", meta=None, created_at=now,
+                     op_key=uuid.uuid4().hex)
+    st.session_state["_analytics_refresh"] = get_io_pool().submit(get_site_analytics().refresh)
+    try:
+        boot = db.bootstrap(session, event, now)
+    except Exception:
+        db.mark_unhealthy()
+        # Запасной путь — как без bootstrap: запись через журнал, чтения — по месту
+        writer = get_event_writer()
+        writer.submit("sessions.upsert", session)
+        if event:
+            writer.submit("events", event)   # тот же op_key: частично прошедший вызов не задвоит событие
+        touch_session()
+        return
+    get_heartbeat().mark(session["session_id"])
+    get_vote_tally().seed(boot["counts"])
+    st.session_state["has_voted"] = boot["voted"]
+    st.session_state["_boot_durations"] = boot["durations"]
+
+def start_page_timer(current_page: str, *, bootstrap: bool = False):
+    """Фиксируем переходы и логируем page_view (bootstrap=True — через bootstrap_page)."""
+    st.session_state["_page_span"] = tracer.start(f"page:{current_page}")
+    boot = bootstrap and "_bootstrapped" not in st.session_state
+    ensure_session(register=not boot)
+    if not boot:
+        touch_session()
     now = time.time()
     prev_page = st.session_state.get("current_page")
     prev_ts   = st.session_state.get("page_enter_ts")
@@ -117,14 +293,19 @@ def start_page_timer(current_page: str):
     if prev_page and prev_ts is not None and prev_page != current_page:
         add_time(prev_page, int(max(0, now - prev_ts)))
 
+    if boot:
+        bootstrap_page(current_page, log_view=prev_page != current_page)
+
     # Старт для текущей
     if prev_page != current_page:
-        log_event(current_page, "page_view")
+        if not boot:
+            log_event(current_page, "page_view")
         st.session_state["current_page"]  = current_page
         st.session_state["page_enter_ts"] = now
 
 def finalize_time_on_rerun():
     touch_session()
+    tracer.finish(st.session_state.pop("_page_span", None))
 
 # ===========================
 # CSS (левый край + чипсы + компактные списки)
@@ -162,30 +343,24 @@ page = st.sidebar.radio(
 )
 
 # ===========================
-# helper: Кнопка «лог + открыть ссылку»
+# helper: Кнопки «лог + открыть ссылку»
 # ===========================
 # --- helper: логируем и открываем ссылку в НОВОЙ вкладке ---
+@st.fragment
 def log_and_open(label: str, url: str, page_name: str, event_name: str, key: str):
     """
-    1) По клику логируем событие в Supabase
-    2) Кладём URL в session_state и делаем st.rerun()
-    3) После ререндера через JS открываем URL в новой вкладке (текущая остаётся)
+    Фрагмент: клик перезапускает только эту кнопку, а не весь скрипт.
+    1) По клику логируем событие (фоновый писатель)
+    2) В том же прогоне фрагмента через JS открываем URL в новой вкладке (текущая остаётся)
     """
     if st.button(label, type="primary", key=key):
-        try:
-            log_event(page_name, event_name, meta=url)
-        finally:
-            st.session_state["_newtab_url"] = url
-            st.rerun()
-
-    new_url = st.session_state.pop("_newtab_url", None)
-    if new_url:
+        log_event(page_name, event_name, meta=url)
         # Откроет новую вкладку; текущая не трогаем
         components.html(
             f"""
             <script>
               try {{
-                window.open("{new_url}", "_blank", "noopener,noreferrer");
+                window.open({json.dumps(url)}, "_blank", "noopener,noreferrer");
               }} catch (e) {{}}
             </script>
             """,
@@ -193,7 +368,301 @@ def log_and_open(label: str, url: str, page_name: str, event_name: str, key: str
         )
         # Фолбэк-кнопка, если вдруг браузер заблокировал (редко)
         st.caption("Если новая вкладка не открылась, нажми 👉")
-        st.link_button("Открыть ссылку", new_url)
+        st.link_button("Открыть ссылку", url)
+
+# Публичный anon-ключ Supabase (с RLS на insert в events) — с ним клики по ссылкам
+# пишутся прямо из браузера, без серверного rerun
+SB_ANON_KEY = st.secrets.get("SUPABASE_ANON_KEY")
+
+def beacon_links(links: list, page_name: str):
+    """
+    Обычные ссылки <a target=_blank> + fetch(keepalive) в /rest/v1/events по клику.
+    links: [(label, url, event_name), ...]. Без SUPABASE_ANON_KEY — фолбэк на log_and_open.
+    """
+    if not SB_ANON_KEY or STORAGE_BACKEND != "supabase":
+        cols = st.columns([1] * (len(links) - 1) + [4])
+        for col, (label, url, event_name) in zip(cols, links):
+            with col:
+                log_and_open(label, url, page_name=page_name, event_name=event_name, key=f"cta_{event_name}")
+        return
+
+    base = {"visitor_id": st.session_state.visitor_id, "session_id": st.session_state.session_id,
+            "page": page_name}
+    anchors = "".join(
+        f'<a class="cta" href="{url}" target="_blank" rel="noopener noreferrer" '
+        f'data-event="{event_name}">{label}</a>'
+        for label, url, event_name in links
+    )
+    components.html(
+        f"""
+        <style>
+          body{{ margin:0; font-family:"Source Sans Pro",sans-serif; }}
+          .row{{ display:flex; gap:12px; flex-wrap:wrap; }}
+          .cta{{ display:inline-block; padding:.45rem .9rem; border-radius:.5rem; color:#fff;
+                 background:#ff4b4b; text-decoration:none; font-size:1rem; line-height:1.6; }}
+          .cta:hover{{ background:#ff2b2b; }}
+        </style>
+        <div class="row">{anchors}</div>
+        <script>
+          const base = {json.dumps(base)};
+          document.querySelectorAll("a.cta").forEach(a => a.addEventListener("click", () => {{
+            try {{
+              fetch({json.dumps(SB_URL.rstrip("/") + "/rest/v1/events")}, {{
+                method: "POST", keepalive: true,
+                headers: {{ "apikey": {json.dumps(SB_ANON_KEY)},
+                            "Authorization": "Bearer " + {json.dumps(SB_ANON_KEY)},
+                            "Content-Type": "application/json", "Prefer": "return=minimal" }},
+                body: JSON.stringify({{ ...base, event_type: a.dataset.event, meta: a.href }})
+              }});
+            }} catch (e) {{}}
+          }}));
+        </script>
+        """,
+        height=52,
+    )
+
+# ===========================
+# helper: Панель голосования (фрагмент)
+# ===========================
+VOTE_TOASTS = {
+    "ok": "Спасибо за голос!",
+    "queued": "Спасибо! Голос сохранён и будет учтён, как только база станет доступна.",
+    "duplicate": "Вы уже голосовали.",
+}
+
+def _on_vote(choice: str):
+    """
+    Колбэк кнопки: выполняется до тела фрагмента, и счётчики ниже рисуются уже с новым голосом.
+    Тост показывает сам фрагмент — выводить элементы из колбэка фрагмента Streamlit не поддерживает.
+    """
+    st.session_state["_vote_status"] = add_vote(choice)
+
+@st.fragment
+def vote_panel():
+    st.subheader("Оценка сайта")
+    status = st.session_state.pop("_vote_status", None)
+    if status:
+        st.toast(VOTE_TOASTS[status])
+    likes, dislikes = get_counts()
+    total = likes + dislikes
+    approval = (likes/total*100) if total else 0
+
+    c1, c2, c3 = st.columns(3)
+    with c1: st.metric("👍 Лайки", likes)
+    with c2: st.metric("👎 Дизлайки", dislikes)
+    with c3: st.metric("Одобрение", f"{approval:.0f}%")
+
+    already_voted = has_voted()
+    b1, b2 = st.columns(2)
+    for col, label, choice in ((b1, "👍 Лайк", "like"), (b2, "👎 Дизлайк", "dislike")):
+        with col:
+            st.button(label, use_container_width=True, disabled=already_voted,
+                      on_click=_on_vote, args=(choice,))
+
+# ===========================
+# helper: Графики «Как пользуются моим сайтом» (вместо внешнего DataLens-iframe)
+# ===========================
+@st.cache_resource
+def get_site_analytics() -> SiteAnalytics:
+    """
+    Одни агрегаты на процесс; каждое обновление дочитывает только новые строки.
+    Первая (полная) загрузка идёт в фоне с созданием — рендер её не ждёт.
+    """
+    an = SiteAnalytics(db, min_interval=float(st.secrets.get("ANALYTICS_REFRESH", 60.0)),
+                       settle_days=float(st.secrets.get("ANALYTICS_SETTLE_DAYS", 2.0)))
+    get_io_pool().submit(an.refresh, True)
+    return an
+
+def site_usage_charts():
+    an = get_site_analytics()
+    pending = st.session_state.pop("_analytics_refresh", None)
+    try:
+        if pending is not None:
+            pending.result()   # запущено в bootstrap_page параллельно с db.bootstrap
+        else:
+            an.refresh()
+    except Exception:
+        # Водяные знаки двигаются только после разбора страницы — рисуем уже прочитанное
+        db.mark_unhealthy()
+    if not an.loaded:
+        st.caption("Агрегаты ещё догружаются — графики показывают уже прочитанную часть.")
+
+    g1, g2 = st.columns(2)
+    with g1:
+        dau = an.dau()
+        fig = px.line(dau, x="day", y="visitors", markers=True, title="DAU — уникальные посетители по дням")
+        fig.update_layout(xaxis_title=None, yaxis_title=None, height=320)
+        st.plotly_chart(fig, use_container_width=True)
+    with g2:
+        views = an.page_views()
+        fig = px.bar(x=views.index, y=views.values, title="Просмотры страниц")
+        fig.update_layout(xaxis_title=None, yaxis_title=None, height=320)
+        st.plotly_chart(fig, use_container_width=True)
+
+    g3, g4 = st.columns(2)
+    with g3:
+        cta = an.cta().reset_index(names="event")
+        fig = px.bar(cta, x="event", y="clicks", text=cta["ctr"].map("{:.1%}".format),
+                     title="CTA: клики и CTR от просмотров «Главной»")
+        fig.update_layout(xaxis_title=None, yaxis_title=None, height=320)
+        st.plotly_chart(fig, use_container_width=True)
+    with g4:
+        lengths = an.session_lengths()
+        fig = px.bar(x=lengths.index.astype(str), y=lengths.values, title="Длительность сессий")
+        fig.update_layout(xaxis_title=None, yaxis_title=None, height=320)
+        st.plotly_chart(fig, use_container_width=True)
+
+# ===========================
+# helper: Картинки из assets/ — готовые WebP/AVIF-варианты нужной ширины (images.py)
+# ===========================
+ASSETS_DIR = Path(__file__).parent / "assets"
+
+@st.cache_resource
+def get_image_variants() -> ImageVariants:
+    """Один кэш на процесс; варианты собираются в фоне на старте, промах get() соберёт сам."""
+    variants = ImageVariants(max_bytes=int(st.secrets.get("IMAGE_CACHE_BYTES", 32 << 20)))
+    threading.Thread(target=variants.warm, args=(sorted(ASSETS_DIR.glob("*.png")),),
+                     name="image-warm", daemon=True).start()
+    return variants
+
+# Медиасервер Streamlit (runtime.media_file_mgr) — внутренний API: пользуемся им только в
+# проверенном диапазоне версий, где add(data, mimetype, coordinates) -> "/media/<id>.<ext>",
+# иначе responsive_image откатывается на st.image.
+MEDIA_API_VERSIONS = ((1, 37), (2, 0))
+
+def _streamlit_version() -> tuple:
+    return tuple(int(p) for p in st.__version__.split(".")[:2] if p.isdigit())
+
+def media_url_factory():
+    """
+    (data, mime, key) -> абсолютный URL файла на медиасервере Streamlit; None — API недоступен.
+    URL строится от корня с server.baseUrlPath (относительный ломается, если адрес страницы
+    без завершающего «/»); прокси, который монтирует приложение под своим путём, задаёт
+    префикс явно через MEDIA_BASE_URL.
+    """
+    lo, hi = MEDIA_API_VERSIONS
+    if not (lo <= _streamlit_version() < hi) or not runtime.exists():
+        return None
+    media = getattr(runtime.get_instance(), "media_file_mgr", None)
+    if media is None or not callable(getattr(media, "add", None)):
+        return None
+    base = st.secrets.get("MEDIA_BASE_URL")
+    if base is None:
+        base_path = (st.get_option("server.baseUrlPath") or "").strip("/")
+        base = f"/{base_path}" if base_path else ""
+
+    def url(data: bytes, mime: str, key: str) -> str:
+        return base.rstrip("/") + "/" + media.add(data, mime, key).lstrip("/")
+    return url
+
+def _picture_html(path: Path, variants: ImageVariants, media_url, sizes: str, caption: str) -> str:
+    widths = variants.widths_for(path)
+
+    def url(width, fmt):
+        return media_url(variants.get(path, width, fmt), MIME[fmt], f"img:{path.name}:{width}:{fmt}")
+
+    sources = "".join(
+        f'<source type="{MIME[fmt]}" sizes="{sizes}" '
+        f'srcset="{", ".join(f"{url(w, fmt)} {w}w" for w in widths)}">'
+        for fmt in variants.formats
+    )
+    w0, h0 = variants.size(path)
+    return (f'<picture>{sources}<img src="{url(widths[-1], "png")}" width="{w0}" height="{h0}" '
+            f'alt="{escape(caption)}" loading="lazy" decoding="async" style="width:100%;height:auto"></picture>')
+
+def responsive_image(path: Path, caption: str, *, sizes: str = "100vw", missing: str = "Изображение не найдено."):
+    """
+    <picture> с srcset по ширинам и форматам: браузер сам берёт AVIF/WebP нужного размера.
+    Байты отдаёт медиасервер Streamlit (как у st.image), но без перекодирования на каждом rerun.
+    Без медиасервера (см. media_url_factory) — обычный st.image исходного PNG.
+    """
+    if not path.exists():
+        st.info(missing)
+        return
+    variants = get_image_variants()
+    media_url = media_url_factory()
+    html = None
+    if media_url is not None:
+        try:
+            html = _picture_html(path, variants, media_url, sizes, caption)
+        except (TypeError, AttributeError):   # внутренний API поменялся внутри проверенного диапазона
+            html = None
+    if html is None:
+        st.image(variants.get(path, variants.widths_for(path)[-1], "png"), caption=caption,
+                 use_container_width=True)
+        return
+    st.html(html)
+    st.caption(caption)
+
+# ===========================
+# helper: Статистика A/B по поюзерным данным (abstats.py) вместо зашитых чисел
+# ===========================
+# Файлы: AB_STREAMING_DATA (group, started, ttfp, crashed) и AB_PAYMENT_DATA (group, converted, revenue),
+# CSV или Parquet. Нет файла — страница показывает опубликованные итоги эксперимента.
+AB_DATA_DIR = Path(__file__).parent / "data"
+
+def ab_data_path(secret: str, default: str):
+    path = Path(st.secrets.get(secret, AB_DATA_DIR / default))
+    return path if path.exists() else None
+
+@st.cache_data(show_spinner="Считаю статистику эксперимента…", persist="disk")
+def ab_report(kind: str, data_hash: str, path: str) -> dict:
+    """Ключ кэша — хэш содержимого: пересчёт только при новых данных, в т.ч. после рестарта."""
+    df = abstats.load(path)
+    if kind == "streaming":
+        return abstats.streaming_report(df, alpha=0.01)
+    return abstats.payment_report(df, alpha=0.05, n_resamples=int(st.secrets.get("AB_RESAMPLES", 10_000)),
+                                  workers=int(st.secrets.get("AB_WORKERS", 0)) or None)
+
+def get_ab_report(kind: str, secret: str, default: str):
+    path = ab_data_path(secret, default)
+    if path is None:
+        return None
+    return ab_report(kind, abstats.dataset_hash(path), str(path))
+
+# Опубликованные итоги — в форме отчётов abstats (данных экспериментов в репозитории нет),
+# чтобы вердикт и без данных считался теми же abstats.*_verdict
+AB_STREAMING_PUBLISHED = {
+    "primary": {"p_a": 0.4049, "p_b": 0.4262, "rel_uplift": 0.0526, "abs_diff": 0.0213,
+                "p_value": 1.069e-05, "ci_low": 0.0088, "ci_high": 0.0338, "alpha": 0.01},
+    "srm_p": 0.002698, "ttfp_p": 0.8027, "ttfp_t": None, "crash_p": 0.6278, "crash_z": None,
+}
+AB_PAYMENT_PUBLISHED = {
+    "cr": {"p_a": 0.021, "p_b": 0.023, "abs_diff": 0.002, "p_value": None, "alpha": 0.05},
+    "arpu": {"mean_a": 1500.0, "mean_b": 1550.0, "p_value": 0.03, "alpha": 0.05},
+}
+
+def _nan_if_none(p):
+    return float("nan") if p is None else p
+
+# ===========================
+# helper: Диагностика для оператора (?ops=<OPS_TOKEN>)
+# ===========================
+def is_operator() -> bool:
+    token = st.secrets.get("OPS_TOKEN")
+    return bool(token) and st.query_params.get("ops") == token
+
+def diagnostics_panel():
+    st.divider()
+    st.subheader("🛠 Диагностика (оператор)")
+    if not tracer.enabled:
+        st.info("Трассировка выключена: TRACING=true в secrets.")
+    else:
+        st.dataframe(tracer.summary(), use_container_width=True, hide_index=True)
+        st.download_button("Скачать трассу (Chrome Trace JSON)", tracer.export_json(),
+                           file_name="site_trace.json", mime="application/json")
+    c1, c2 = st.columns(2)
+    with c1:
+        st.markdown("**Фоновый писатель**")
+        st.json(get_event_writer().stats())
+    with c2:
+        st.markdown("**Heartbeat / голоса**")
+        st.json({"heartbeat": get_heartbeat().stats(), "votes": get_vote_tally().stats()})
+    if STORAGE_BACKEND == "supabase":
+        st.markdown("**Supabase pool**")
+        st.json(get_supabase_pool().stats())
+    st.markdown("**Картинки (варианты в памяти)**")
+    st.json(get_image_variants().stats())
 
 # ===========================
 # СТРАНИЦЫ
@@ -245,16 +714,11 @@ if page == "Главная":
 
     # CTA: 3 «умные» кнопки (лог + переход)
     st.markdown("<h4 class='section-title'>Быстрая связь со мной</h4>", unsafe_allow_html=True)
-    cta1, cta2, cta3 = st.columns([1, 1, 4])
-    with cta1:
-        log_and_open("📨 Открыть Telegram", "https://t.me/cldmatv",
-                     page_name="Главная", event_name="tg_click", key="tg_main")
-    with cta2:
-        log_and_open("🐱 Открыть GitHub", "https://github.com/MSSAS",
-                     page_name="Главная", event_name="gh_click", key="gh_main")
-    with cta3:
-        log_and_open("📄 Открыть резюме", "https://sochi.hh.ru/resume/b872d5b3ff0f3adc440039ed1f786c7a745332",
-                     page_name="Главная", event_name="resume_click", key="cv_main")
+    beacon_links([
+        ("📨 Открыть Telegram", "https://t.me/cldmatv", "tg_click"),
+        ("🐱 Открыть GitHub", "https://github.com/MSSAS", "gh_click"),
+        ("📄 Открыть резюме", "https://sochi.hh.ru/resume/b872d5b3ff0f3adc440039ed1f786c7a745332", "resume_click"),
+    ], page_name="Главная")
 
     finalize_time_on_rerun()
 
@@ -276,11 +740,8 @@ elif page == "Дашборды":
         st.write("Задача: анализ продаж, прибыли, AKB, среднего чека и рентабельности по регионам и сегментам.")
         st.link_button("📥 Скачать .pbix", "https://drive.google.com/drive/folders/1zlu_QaB6J96GlohndvQwuAnbmle2USGo?usp=sharing")
 
-        img_path = Path(__file__).parent / "assets" / "sales_dashboard.png"
-        if img_path.exists():
-            st.image(str(img_path), caption="Дашборд аналитики продаж", use_container_width=True)
-        else:
-            st.info("Изображение не найдено. Помести файл в `assets/sales_dashboard.png`")
+        responsive_image(ASSETS_DIR / "sales_dashboard.png", "Дашборд аналитики продаж",
+                         missing="Изображение не найдено. Помести файл в `assets/sales_dashboard.png`")
 
     finalize_time_on_rerun()
 
@@ -326,12 +787,13 @@ elif page == "A/B-тесты":
         st.markdown("---")
 
         # ===== 2) Результат (кратко): 4 KPI =====
-        pA, pB = 0.4049, 0.4262
-        rel_uplift, abs_diff_pp = 0.0526, 2.13
-        p_val = 1.069e-05
-        ci_low_pp, ci_high_pp = 0.88, 3.38
-        p_ttfp, p_crash = 0.8027, 0.6278
-        srm_p = 0.002698
+        rep = get_ab_report("streaming", "AB_STREAMING_DATA", "ab_streaming.parquet") or AB_STREAMING_PUBLISHED
+        prim = rep["primary"]
+        rel_uplift, abs_diff_pp = prim["rel_uplift"], prim["abs_diff"] * 100
+        p_val = prim["p_value"]
+        ci_low_pp, ci_high_pp = prim["ci_low"] * 100, prim["ci_high"] * 100
+        p_ttfp, p_crash = _nan_if_none(rep["ttfp_p"]), _nan_if_none(rep["crash_p"])
+        srm_p = rep["srm_p"]
 
         k1, k2, k3, k4 = st.columns(4)
         with k1: st.metric("A → B (uplift)", f"{rel_uplift:.2%}")
@@ -339,19 +801,21 @@ elif page == "A/B-тесты":
         with k3: st.metric("p-value", f"{p_val:.2e}")
         with k4: st.metric("99% доверительный интервал", f"[{ci_low_pp:.2f}; {ci_high_pp:.2f}]")
         st.caption(f"Guardrails: TTFP p={p_ttfp:.4f}, Crash p={p_crash:.4f} · SRM p={srm_p:.4g}")
-        # Финальный вердикт
-        st.success("Вердикт: SUCCESS — раскатка 25%→50%→100% + пост-мониторинг.")
+        # Финальный вердикт — из отчёта, по критериям из дизайна
+        ok, fails = abstats.streaming_verdict(rep)
+        if ok:
+            st.success("Вердикт: SUCCESS — раскатка 25%→50%→100% + пост-мониторинг.")
+        else:
+            st.warning(f"Вердикт: критерии успеха не выполнены — {'; '.join(fails)}.")
         st.markdown("---")
 
         # ===== 3) График + материалы =====
         g1, g2 = st.columns([1.15, 0.85])
         with g1:
             st.markdown("#### Динамика по дням")
-            img_path = Path(__file__).parent / "assets" / "ab_streaming_daily.png"
-            if img_path.exists():
-                st.image(str(img_path), use_container_width=True, caption="Daily conversion (A vs B)")
-            else:
-                st.info("Добавь `assets/ab_streaming_daily.png` — график появится здесь.")
+            responsive_image(ASSETS_DIR / "ab_streaming_daily.png", "Daily conversion (A vs B)",
+                             sizes="(max-width: 640px) 100vw, 55vw",
+                             missing="Добавь `assets/ab_streaming_daily.png` — график появится здесь.")
         with g2:
             st.markdown("#### Материалы")
             st.link_button("Код на GitHub", "https://github.com/MSSAS/abtest-streaming-homefeed") 
@@ -365,12 +829,31 @@ elif page == "A/B-тесты":
 - 📈 Интерпретация p-value и доверительных интервалов.
         """)
         st.markdown("##### Результаты")
-        st.write("""
+        pay = get_ab_report("payment", "AB_PAYMENT_DATA", "ab_payment.parquet")
+        if pay is not None:
+            cr, arpu = pay["cr"], pay["arpu"]
+            verdict = "статистически значимо" if arpu["p_value"] < arpu["alpha"] else "не значимо"
+            boot = ""
+            if "boot_ci" in arpu:
+                boot = (f"- **95% bootstrap ДИ (ARPU B−A):** [{arpu['boot_ci'][0]:.0f}; {arpu['boot_ci'][1]:.0f}] ₽, "
+                        f"permutation p = {arpu['perm_p']:.3g}  \n")
+            st.write(f"""
+- **A (контроль):** CR = {cr['p_a']:.1%}, ARPU = {arpu['mean_a']:.0f} ₽
+- **B (новая механика):** CR = {cr['p_b']:.1%}, ARPU = {arpu['mean_b']:.0f} ₽
+- **p-value (t-test ARPU):** {arpu['p_value']:.2g} — {verdict}
+- **p-value (z-test CR):** {cr['p_value']:.2g}
+{boot}""")
+        else:
+            st.write("""
 - **A (контроль):** CR = 2.1%, ARPU = 1500 ₽  
 - **B (новая механика):** CR = 2.3%, ARPU = 1550 ₽  
 - **p-value (t-test ARPU):** 0.03 (< 0.05) — статистически значимо  
         """)
-        st.success("Итог: SUCCESS — новую механику — рекомендовано к внедрению.")
+        ok, fails = abstats.payment_verdict(pay or AB_PAYMENT_PUBLISHED)
+        if ok:
+            st.success("Итог: SUCCESS — новую механику — рекомендовано к внедрению.")
+        else:
+            st.warning(f"Итог: внедрение не рекомендовано — {'; '.join(fails)}.")
         # твоя ссылка
         st.link_button("Код на GitHub", "https://github.com/MSSAS/AB-test_payment")
 
@@ -379,50 +862,21 @@ elif page == "A/B-тесты":
 
 # --- Аналитика сайта ---
 elif page == "Аналитика сайта":
-    start_page_timer("Аналитика сайта")
+    start_page_timer("Аналитика сайта", bootstrap=True)
 
     st.header("📊 Аналитика сайта (Supabase)")
 
-    # Голосование (1-user-1-vote)
-    st.subheader("Оценка сайта")
-    likes, dislikes = get_counts()
-    total = likes + dislikes
-    approval = (likes/total*100) if total else 0
-
-    c1, c2, c3 = st.columns(3)
-    with c1: st.metric("👍 Лайки", likes)
-    with c2: st.metric("👎 Дизлайки", dislikes)
-    with c3: st.metric("Одобрение", f"{approval:.0f}%")
-
-    already_voted = has_voted()
-    b1, b2 = st.columns(2)
-    with b1:
-        if st.button("👍 Лайк", use_container_width=True, disabled=already_voted):
-            if add_vote("like"):
-                st.success("Спасибо за голос!")
-                st.rerun()
-            else:
-                st.info("Вы уже голосовали.")
-    with b2:
-        if st.button("👎 Дизлайк", use_container_width=True, disabled=already_voted):
-            if add_vote("dislike"):
-                st.success("Спасибо за голос!")
-                st.rerun()
-            else:
-                st.info("Вы уже голосовали.")
+    # Голосование (1-user-1-vote) — фрагмент, клик не перезапускает страницу
+    vote_panel()
 
     st.divider()
     st.subheader("Как пользуются моим сайтом")
 
-    iframe_code = """
-        <iframe title="DataLens" width="1700" height="610" src="https://datalens.yandex/27osxw8nptnmn"></iframe>
-        """
-    components.html(iframe_code, height=615)
+    site_usage_charts()
 
     st.markdown("#### Ваше время на страницах (суммарно)")
         # Время на страницах
-    dur_rows = sb.table("durations").select("page,seconds").execute().data or []
-    durations = {r["page"]: (r.get("seconds") or 0) for r in dur_rows if r.get("page")}
+    durations = page_durations()
     cols = st.columns(5)
     pages_list = ["Главная", "Дашборды", "A/B-тесты", "Аналитика сайта", "Контакты"]
     for i, p in enumerate(pages_list):
@@ -434,6 +888,9 @@ elif page == "Аналитика сайта":
     st.markdown("#### Ваша текущая сессия")
     st.code(f"visitor_id={st.session_state.visitor_id}\nsession_id={st.session_state.session_id}", language="text")
 
+    if is_operator():
+        diagnostics_panel()
+
     finalize_time_on_rerun()
 
 # --- Контакты ---
@@ -447,4 +904,6 @@ elif page == "Контакты":
     st.write("- 🐱 GitHub: [github.com/MSSAS](https://github.com/MSSAS)")
     st.write("- 📱 Telegram: [@cldmatv](https://t.me/cldmatv)")
 
-    finalize_time_on_rerun()
\ No newline at end of file
+    finalize_time_on_rerun()
+
+tracer.finish(_rerun_span)
@@ -0,0 +1,149 @@
+# images.py — адаптивные варианты скриншотов из assets/: WebP/AVIF в нескольких ширинах, LRU в памяти
+
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, features
+
+WIDTHS = (480, 960, 1440)
+QUALITY = {"avif": 60, "webp": 80}
+MIME = {"avif": "image/avif", "webp": "image/webp", "png": "image/png"}
+
+
+def available_formats() -> tuple:
+    """Современные форматы, которые умеет кодировать установленный Pillow (AVIF — с 11.2)."""
+    return tuple(f for f in ("avif", "webp") if features.check(f))
+
+
+def encode(img: Image.Image, width: int, fmt: str, quality: int = None) -> bytes:
+    if width < img.width:
+        img = img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+    buf = io.BytesIO()
+    if fmt == "png":
+        img.save(buf, "PNG", optimize=True)
+    elif fmt == "webp":
+        img.save(buf, "WEBP", quality=quality or QUALITY["webp"], method=4)
+    else:
+        img.save(buf, fmt.upper(), quality=quality or QUALITY.get(fmt, 75))
+    return buf.getvalue()
+
+
+class ImageVariants:
+    """
+    Готовые варианты картинок: форматы formats × ширины widths, не шире исходника,
+    плюс исходный PNG как запасной. Байты лежат в LRU, ограниченном max_bytes; ключ —
+    (path, mtime_ns, width, fmt), так что заменённый файл пересобирается сам,
+    а старые варианты вытесняются.
+
+    Исходник декодируется один раз на сборку всех его вариантов — warm() на старте
+    или при первом промахе get(); на горячем пути только os.stat и словарь.
+    """
+
+    def __init__(self, *, widths=WIDTHS, formats=None, max_bytes: int = 32 << 20):
+        self.widths = tuple(sorted(widths))
+        self.formats = tuple(formats) if formats is not None else available_formats()
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._bytes = 0
+        self._sizes = {}            # (path, mtime_ns) -> (width, height) исходника
+        self.hits = self.misses = self.builds = self.evictions = 0
+
+    # --- сборка ---
+    def _key(self, path):
+        path = str(path)
+        return path, os.stat(path).st_mtime_ns
+
+    def _cached(self, path: str, mtime_ns: int):
+        size = self._sizes.get((path, mtime_ns))
+        if size is None:
+            return None
+        found = {k: self._lru.get((path, mtime_ns) + k) for k in self._variant_keys(size[0])}
+        return found if all(v is not None for v in found.values()) else None
+
+    def _build(self, path: str, mtime_ns: int) -> dict:
+        with self._build_lock:
+            with self._lock:
+                cached = self._cached(path, mtime_ns)   # пока ждали, собрал другой поток
+            if cached is not None:
+                return cached
+            with open(path, "rb") as f:
+                raw = f.read()
+            with Image.open(io.BytesIO(raw)) as src:
+                src.load()
+                size = src.size
+                img = src if src.mode in ("RGB", "RGBA") else src.convert("RGBA")
+                built = {(w, fmt): encode(img, w, fmt) for w, fmt in self._variant_keys(size[0])
+                         if fmt != "png"}
+            built[(size[0], "png")] = raw
+        with self._lock:
+            self._sizes[(path, mtime_ns)] = size
+            for (w, fmt), data in built.items():
+                self._put((path, mtime_ns, w, fmt), data)
+            self.builds += 1
+        return built
+
+    def _put(self, key, data: bytes):
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._lru[key] = data
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes and len(self._lru) > 1:
+            _, dropped = self._lru.popitem(last=False)
+            self._bytes -= len(dropped)
+            self.evictions += 1
+
+    def _widths_for(self, src_width: int) -> list:
+        return [w for w in self.widths if w < src_width] + [src_width]
+
+    def _variant_keys(self, src_width: int) -> list:
+        # PNG — только исходник как есть: уменьшенный PNG со сглаживанием выходит тяжелее оригинала
+        return [(w, fmt) for w in self._widths_for(src_width) for fmt in self.formats] + [(src_width, "png")]
+
+    def warm(self, paths) -> int:
+        """Собрать варианты заранее (на старте процесса). Возвращает число собранных файлов."""
+        n = 0
+        for p in paths:
+            path, mtime_ns = self._key(p)
+            if (path, mtime_ns) not in self._sizes:
+                self._build(path, mtime_ns)
+                n += 1
+        return n
+
+    # --- чтение ---
+    def size(self, path) -> tuple:
+        """(ширина, высота) исходника."""
+        path, mtime_ns = self._key(path)
+        if (path, mtime_ns) not in self._sizes:
+            self._build(path, mtime_ns)
+        return self._sizes[(path, mtime_ns)]
+
+    def widths_for(self, path) -> list:
+        return self._widths_for(self.size(path)[0])
+
+    def get(self, path, width: int, fmt: str) -> bytes:
+        path, mtime_ns = self._key(path)
+        key = (path, mtime_ns, width, fmt)
+        with self._lock:
+            data = self._lru.get(key)
+            if data is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        return self._build(path, mtime_ns)[(width, fmt)]
+
+    def best_width(self, path, target: int) -> int:
+        """Наименьший вариант не уже target (или самый широкий)."""
+        widths = self.widths_for(path)
+        return next((w for w in widths if w >= target), widths[-1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._lru), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "builds": self.builds,
+                    "evictions": self.evictions, "formats": list(self.formats)}
@@ -0,0 +1,108 @@
+# resources.py — долгоживущий Supabase-клиент на процесс (пул HTTP-соединений, health-check)
+
+import logging
+import threading
+import time
+
+import httpx
+from supabase import create_client
+
+try:   # supabase>=2.10: синхронные опции принимают свой httpx-клиент
+    from supabase.lib.client_options import SyncClientOptions as _Options
+except ImportError:
+    from supabase.lib.client_options import ClientOptions as _Options
+
+log = logging.getLogger(__name__)
+
+
+class SupabasePool:
+    """
+    Один Supabase/PostgREST-клиент на процесс поверх пула keep-alive соединений.
+
+    Обращения вида pool.table(...)/pool.rpc(...) проксируются в текущий клиент,
+    поэтому после переподключения вызывающий код ничего не меняет. Фоновый поток
+    раз в health_interval делает лёгкий запрос и пересоздаёт клиент при ошибке;
+    mark_unhealthy() просит проверить здоровье досрочно.
+
+    Старый клиент после reconnect() закрывается не сразу, а через close_grace секунд
+    (по умолчанию — два таймаута запроса): запросы, которые другие потоки уже начали
+    на нём, успевают завершиться, а не падают на закрытом пуле.
+    """
+
+    def __init__(self, url: str, key: str, *, max_connections: int = 20, max_keepalive: int = 10,
+                 keepalive_expiry: float = 30.0, timeout: float = 10.0,
+                 health_interval: float = 60.0, health_table: str = "votes", close_grace: float = None):
+        self._url, self._key = url, key
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = timeout
+        self.close_grace = 2 * timeout if close_grace is None else close_grace
+        self.health_interval = health_interval
+        self.health_table = health_table
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._http = None
+        self._client = None
+        self.reconnects = 0
+        self.last_health = None     # (ok: bool, ms: float, unix-время)
+        self._connect()
+        threading.Thread(target=self._watch, name="supabase-health", daemon=True).start()
+
+    @property
+    def client(self):
+        return self._client
+
+    def __getattr__(self, name):
+        # table / rpc / storage / ... — в актуальный клиент
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._client, name)
+
+    def check(self) -> bool:
+        t0 = time.perf_counter()
+        try:
+            self._client.table(self.health_table).select("id").limit(1).execute()
+            ok = True
+        except Exception:
+            log.warning("SupabasePool: health-check не прошёл", exc_info=True)
+            ok = False
+        self.last_health = (ok, (time.perf_counter() - t0) * 1000, time.time())
+        return ok
+
+    def reconnect(self):
+        with self._lock:
+            old = self._http
+            self._connect()
+            self.reconnects += 1
+        if old is not None:
+            closer = threading.Timer(self.close_grace, old.close)
+            closer.daemon = True
+            closer.start()
+
+    def mark_unhealthy(self):
+        self._wake.set()
+
+    def stats(self) -> dict:
+        ok, ms, ts = self.last_health or (None, None, None)
+        return {"healthy": ok, "health_ms": ms, "checked_at": ts, "reconnects": self.reconnects,
+                "max_connections": self.limits.max_connections}
+
+    def _connect(self):
+        self._http = httpx.Client(limits=self.limits, timeout=self.timeout)
+        try:
+            opts = _Options(postgrest_client_timeout=self.timeout, httpx_client=self._http)
+        except TypeError:
+            # Старый supabase-py: свой httpx-клиент не передать, но postgrest внутри
+            # клиента держит собственную keep-alive сессию — важно лишь не пересоздавать его
+            self._http.close()
+            self._http = None
+            opts = _Options(postgrest_client_timeout=self.timeout)
+        self._client = create_client(self._url, self._key, options=opts)
+
+    def _watch(self):
+        while True:
+            self._wake.wait(self.health_interval)
+            self._wake.clear()
+            if not self.check():
+                self.reconnect()
@@ -0,0 +1,71 @@
+# bench_abstats.py — пропускная способность ресемплинга abstats на синтетике
+#
+#   python scripts/bench_abstats.py --users 1000000 --resamples 10000 --workers 4
+#
+# Генерирует платёжный эксперимент (CR ~2.1% / 2.3%, выручка логнормальная) и меряет
+# отчёт целиком, bootstrap CI и permutation p-value для ARPU и CR. Пропускная способность —
+# пользователи × ресемплы в секунду (сколько поюзерных значений «прошло» через ресемплинг).
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import abstats  # noqa: E402
+
+
+def synth(users: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    group = np.where(rng.random(users) < 0.5, "A", "B")
+    cr = np.where(group == "A", 0.021, 0.023)
+    converted = (rng.random(users) < cr).astype(np.int8)
+    check = rng.lognormal(np.log(70_000), 0.6, users)
+    revenue = np.where(converted == 1, check, 0.0)
+    return pd.DataFrame({"group": group, "converted": converted, "revenue": revenue})
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1_000_000)
+    ap.add_argument("--resamples", type=int, default=10_000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    df = synth(args.users, args.seed)
+    work = args.users * args.resamples
+    results = {"users": args.users, "resamples": args.resamples, "workers": args.workers}
+
+    for metric in ("revenue", "converted"):
+        a, b = abstats.split(df, metric)
+        ci, t_boot = timed(abstats.bootstrap_diff_ci, a, b, n_resamples=args.resamples,
+                           workers=args.workers, seed=args.seed)
+        p, t_perm = timed(abstats.permutation_pvalue, a, b, n_resamples=args.resamples,
+                          workers=args.workers, seed=args.seed)
+        results[metric] = {
+            "bootstrap_ci": [round(x, 4) for x in ci], "bootstrap_s": round(t_boot, 3),
+            "bootstrap_user_resamples_per_s": round(work / t_boot),
+            "permutation_p": round(p, 5), "permutation_s": round(t_perm, 3),
+            "permutation_user_resamples_per_s": round(work / t_perm),
+        }
+
+    _, t_report = timed(abstats.payment_report, df, n_resamples=args.resamples, workers=args.workers)
+    results["payment_report_s"] = round(t_report, 3)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
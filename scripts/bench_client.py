@@ -0,0 +1,55 @@
+# bench_client.py — микро-бенчмарк: клиент на каждый rerun (как было) vs общий пул
+#
+#   SUPABASE_URL=... SUPABASE_KEY=... python scripts/bench_client.py --reruns 50
+#
+# «Rerun» здесь — то, что app.py делал с Supabase на каждом взаимодействии:
+# построить клиент (или взять готовый) и выполнить один лёгкий запрос.
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from supabase import create_client  # noqa: E402
+
+from resources import SupabasePool  # noqa: E402
+
+
+def _summary(samples: list) -> dict:
+    q = statistics.quantiles(samples, n=100)
+    return {"p50_ms": q[49], "p95_ms": q[94], "mean_ms": statistics.fmean(samples)}
+
+
+def bench(reruns: int, table: str) -> dict:
+    url, key = os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"]
+
+    before = []
+    for _ in range(reruns):
+        t0 = time.perf_counter()
+        create_client(url, key).table(table).select("id").limit(1).execute()
+        before.append((time.perf_counter() - t0) * 1000)
+
+    pool = SupabasePool(url, key, health_interval=3600)
+    pool.table(table).select("id").limit(1).execute()   # прогрев соединения
+    after = []
+    for _ in range(reruns):
+        t0 = time.perf_counter()
+        pool.table(table).select("id").limit(1).execute()
+        after.append((time.perf_counter() - t0) * 1000)
+
+    res = {"reruns": reruns, "per_rerun_client": _summary(before), "pooled": _summary(after)}
+    res["speedup_p50"] = res["per_rerun_client"]["p50_ms"] / res["pooled"]["p50_ms"]
+    return res
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--reruns", type=int, default=50)
+    ap.add_argument("--table", default="votes")
+    args = ap.parse_args()
+    print(json.dumps(bench(args.reruns, args.table), indent=2))
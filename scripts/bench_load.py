@@ -0,0 +1,263 @@
+# bench_load.py — нагрузочный бенчмарк app.py: N посетителей вперемешку через Streamlit AppTest
+#
+#   python scripts/bench_load.py --visitors 20 --out bench_results.json
+#
+# Приложение крутится целиком в процессе на SQLiteStorage (STORAGE_BACKEND="sqlite"),
+# методы хранилища обёрнуты записывающим прокси: каждый вызов — один «round trip».
+# Сценарии (flows):
+#   browse — обход пяти страниц из сайдбара;
+#   vote   — «Аналитика сайта» + лайк;
+#   cta    — «Главная» + клики по трём CTA-кнопкам.
+# На выходе — JSON: p50/p95/p99 латентности rerun, round trips и байты на rerun,
+# пиковая память сверх базовой. Файлы разных прогонов можно сравнивать между собой.
+#
+# Перед замерами каждый сценарий один раз прогоняется вхолостую: импорты, кэши
+# st.cache_resource и схема базы не попадают ни в латентность, ни в память первого flow.
+
+import argparse
+import functools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import streamlit  # noqa: E402
+from streamlit import config  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import storage  # noqa: E402
+
+PAGES = ["Главная", "Дашборды", "A/B-тесты", "Аналитика сайта", "Контакты"]
+BACKGROUND_THREADS = ("spool-drainer", "event-writer", "supabase-health", "io", "image-warm")
+
+# AppTest.run() ставит и по окончании обнуляет глобальный Runtime._instance — два run() в
+# разных потоках роняют друг друга. Rerun'ы посетителей идут по одному (латентность меряем
+# внутри блокировки), посетители чередуются между rerun'ами, фоновые потоки работают параллельно.
+_RUN_LOCK = threading.Lock()
+
+
+# ===========================
+# Записывающая обёртка над хранилищем
+# ===========================
+class Recorder:
+    """Счётчики вызовов хранилища: синхронные (поток скрипта) и фоновые (писатель)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = defaultdict(int)     # (sync|background, method) -> n
+        self.bytes = defaultdict(int)     # sync|background -> байты запросов+ответов (JSON)
+
+    def record(self, method: str, args, result):
+        where = "background" if threading.current_thread().name.startswith(BACKGROUND_THREADS) else "sync"
+        size = len(json.dumps([args, result], default=str, ensure_ascii=False).encode())
+        with self._lock:
+            self.calls[(where, method)] += 1
+            self.bytes[where] += size
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"calls": dict(self.calls), "bytes": dict(self.bytes)}
+
+
+def instrument(cls, recorder: Recorder):
+    """Оборачиваем публичные методы Storage на классе (app.py импортирует его сам)."""
+    for name, fn in vars(storage.Storage).items():
+        if name.startswith("_") or name == "write_batch" or not callable(fn):
+            continue
+        impl = getattr(cls, name)
+
+        def wrapper(self, *args, __impl=impl, __name=name, **kwargs):
+            out = __impl(self, *args, **kwargs)
+            recorder.record(__name, args, out)
+            return out
+
+        setattr(cls, name, functools.wraps(impl)(wrapper))
+
+
+def _delta(before: dict, after: dict, where: str) -> tuple:
+    calls = sum(n for (w, _), n in after["calls"].items() if w == where) \
+        - sum(n for (w, _), n in before["calls"].items() if w == where)
+    return calls, after["bytes"].get(where, 0) - before["bytes"].get(where, 0)
+
+
+def _ui_bytes(at: AppTest) -> int:
+    """Размер protobuf-элементов, которые rerun отдал бы в браузер (best-effort по дереву AppTest)."""
+    total, stack = 0, [at._tree]
+    while stack:
+        node = stack.pop()
+        proto = getattr(node, "proto", None)
+        if proto is not None and hasattr(proto, "ByteSize"):
+            total += proto.ByteSize()
+        children = getattr(node, "children", None)
+        if isinstance(children, dict):
+            stack.extend(children.values())
+    return total
+
+
+# ===========================
+# Посетители и сценарии
+# ===========================
+class Visitor:
+    def __init__(self, recorder: Recorder, timeout: float):
+        # Секреты не через at.secrets: AppTest подменяет глобальный st.secrets на время run(),
+        # и параллельные посетители (и rerun'ы фрагментов) видят чужую подмену или пустоту
+        self.at = AppTest.from_file(str(ROOT / "app.py"), default_timeout=timeout)
+        # Куки-компонент в AppTest не отвечает — сразу кладём visitor_id, как после первого визита
+        self.at.session_state["visitor_id"] = str(uuid.uuid4())
+        self.recorder = recorder
+        self.samples = []
+
+    def rerun(self, action):
+        with _RUN_LOCK:
+            before = self.recorder.snapshot()
+            t0 = time.perf_counter()
+            action()
+            ms = (time.perf_counter() - t0) * 1000
+            after = self.recorder.snapshot()
+        calls, db_bytes = _delta(before, after, "sync")
+        if self.at.exception:
+            raise RuntimeError(f"app raised: {self.at.exception[0].value}")
+        self.samples.append({"ms": ms, "db_calls": calls, "db_bytes": db_bytes, "ui_bytes": _ui_bytes(self.at)})
+
+    def goto(self, page: str):
+        self.rerun(lambda: self.at.sidebar.radio[0].set_value(page).run())
+
+    def click(self, *, label: str = None, key: str = None):
+        btn = self.at.button(key=key) if key else next(b for b in self.at.button if b.label == label)
+        self.rerun(lambda: btn.click().run())
+
+
+def flow_browse(v: Visitor):
+    v.rerun(v.at.run)
+    for p in PAGES[1:] + PAGES[:1]:
+        v.goto(p)
+
+
+def flow_vote(v: Visitor):
+    v.rerun(v.at.run)
+    v.goto("Аналитика сайта")
+    v.click(label="👍 Лайк")
+    v.rerun(v.at.run)          # повторный рендер панели: в steady state без запросов к базе
+
+
+def flow_cta(v: Visitor):
+    v.rerun(v.at.run)
+    for key in ("cta_tg_click", "cta_gh_click", "cta_resume_click"):
+        v.click(key=key)
+
+
+FLOWS = {"browse": flow_browse, "vote": flow_vote, "cta": flow_cta}
+
+
+def _pct(values: list) -> dict:
+    if len(values) < 2:
+        v = values[0] if values else 0.0
+        return {"p50": v, "p95": v, "p99": v}
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98]}
+
+
+def warm_up(recorder: Recorder, timeout: float):
+    """По одному посетителю на сценарий, без замеров."""
+    for flow in FLOWS.values():
+        flow(Visitor(recorder, timeout))
+
+
+def run_flow(name: str, visitors: int, recorder: Recorder, timeout: float) -> dict:
+    """Пик памяти — сверх занятой на старте flow (tracemalloc уже запущен в main)."""
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    t0 = time.perf_counter()
+
+    def one(_):
+        v = Visitor(recorder, timeout)
+        FLOWS[name](v)
+        return v.samples
+
+    with ThreadPoolExecutor(max_workers=visitors) as ex:
+        samples = [s for batch in ex.map(one, range(visitors)) for s in batch]
+    wall = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+
+    n = len(samples)
+    return {
+        "visitors": visitors,
+        "reruns": n,
+        "wall_s": wall,
+        "rerun_ms": _pct([s["ms"] for s in samples]),
+        "db_round_trips_per_rerun": sum(s["db_calls"] for s in samples) / n,
+        "db_bytes_per_rerun": sum(s["db_bytes"] for s in samples) / n,
+        "ui_bytes_per_rerun": sum(s["ui_bytes"] for s in samples) / n,
+        "peak_mem_mb": (peak - base) / 2**20,
+        "base_mem_mb": base / 2**20,
+    }
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--visitors", type=int, default=10)
+    ap.add_argument("--flows", default=",".join(FLOWS))
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--out", default="bench_results.json")
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_load_"))
+    secrets = tmp / "secrets.toml"
+    secrets.write_text(
+        f'STORAGE_BACKEND = "sqlite"\n'
+        f'SQLITE_PATH = {json.dumps(str(tmp / "site.db"))}\n'
+        f'SPOOL_PATH = {json.dumps(str(tmp / "spool.db"))}\n', encoding="utf-8")
+    config.set_option("secrets.files", [str(secrets)])
+    recorder = Recorder()
+    instrument(storage.SQLiteStorage, recorder)
+    warm_up(recorder, args.timeout)
+    warm = recorder.snapshot()
+    tracemalloc.start()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "streamlit": streamlit.__version__,
+            "backend": "sqlite",
+        },
+        "flows": {},
+    }
+    for name in args.flows.split(","):
+        results["flows"][name] = run_flow(name, args.visitors, recorder, args.timeout)
+        print(f"{name:>7}: {json.dumps(results['flows'][name])}", file=sys.stderr)
+
+    time.sleep(2)   # даём фоновому писателю дослать хвост
+    tracemalloc.stop()
+    snap = recorder.snapshot()
+    calls = {k: n - warm["calls"].get(k, 0) for k, n in snap["calls"].items()}   # без холостого прогона
+    results["background_round_trips"] = sum(n for (w, _), n in calls.items() if w == "background")
+    results["calls_by_method"] = {f"{w}:{m}": n for (w, m), n in sorted(calls.items()) if n}
+
+    Path(args.out).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# compact_events.py — ретеншн: сырые events старше горизонта -> дневные агрегаты events_daily
+#
+#   SUPABASE_URL=... SUPABASE_KEY=<service key> python scripts/compact_events.py --horizon-days 30
+#   python scripts/compact_events.py --sqlite site_analytics.db --horizon-days 30
+#
+# Работает порциями по --chunk событий: каждая порция переносится в агрегаты и удаляется
+# одной транзакцией (sql/compact_events.sql), так что джоб можно прерывать и перезапускать —
+# счётчики не задваиваются. Живые вставки не блокируются: трогаются только строки старше
+# горизонта, а занятые строки пропускаются (skip locked). Горизонт округляется до начала
+# дня UTC и публикуется для читателей (site_analytics.py) только после проверки, что
+# событий старше него не осталось. Код выхода 1 — свёртка не завершена (status в JSON):
+#   busy       — идёт другой джоб (advisory lock занят);
+#   incomplete — после --retries попыток остались пропущенные skip locked строки.
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from storage import COMPACTION_BUSY, SQLiteStorage, SupabaseStorage  # noqa: E402
+
+
+def compact(storage, before: str, chunk: int, pause: float, retries: int = 5) -> dict:
+    t0 = time.perf_counter()
+    moved, chunks, attempts = 0, 0, 0
+    while True:
+        n = storage.compact_events(before, chunk)
+        if n == COMPACTION_BUSY:
+            status = "busy"
+            break
+        if n:
+            moved += n
+            chunks += 1
+            time.sleep(pause)   # даём дорогу живой нагрузке между порциями
+            continue
+        # 0 — либо всё перенесено, либо skip locked пропустил занятые строки: проверяет finish_compaction
+        if storage.finish_compaction(before):
+            status = "done"
+            break
+        attempts += 1
+        if attempts > retries:
+            status = "incomplete"
+            break
+        time.sleep(pause * 2 ** attempts)
+    secs = time.perf_counter() - t0
+    return {"before": before, "status": status, "moved": moved, "chunks": chunks, "seconds": round(secs, 3)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--horizon-days", type=int, default=30, help="сколько дней сырых событий оставлять")
+    ap.add_argument("--chunk", type=int, default=5000)
+    ap.add_argument("--pause", type=float, default=0.05, help="пауза между порциями, с")
+    ap.add_argument("--retries", type=int, default=5,
+                    help="сколько раз перепроверять остаток, пропущенный skip locked")
+    ap.add_argument("--sqlite", help="путь к базе SQLiteStorage вместо Supabase")
+    args = ap.parse_args()
+
+    if args.sqlite:
+        storage = SQLiteStorage(args.sqlite)
+    else:
+        from resources import SupabasePool
+        storage = SupabaseStorage(SupabasePool(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"],
+                                               health_interval=3600))
+    before = (datetime.now(timezone.utc) - timedelta(days=args.horizon_days)).date().isoformat()
+    result = compact(storage, before, args.chunk, args.pause, args.retries)
+    print(json.dumps(result, ensure_ascii=False))
+    if result["status"] != "done":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
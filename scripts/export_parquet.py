@@ -0,0 +1,168 @@
+# export_parquet.py — потоковая выгрузка events / sessions / durations / votes в Parquet по дням
+#
+#   SUPABASE_URL=... SUPABASE_KEY=... python scripts/export_parquet.py --out export/
+#   python scripts/export_parquet.py --sqlite site_analytics.db --out export/
+#
+# Каждая таблица читается keyset-пагинацией по (created_at, id) страницами по --page-size
+# строк (без OFFSET и без упора в лимит строк PostgREST), в памяти — не больше
+# --rows-per-file строк на таблицу. Раскладка: <out>/<table>/date=YYYY-MM-DD/part-<id>.parquet.
+# Таблицы выгружаются параллельно.
+#
+# events / votes — инкрементально: водяной знак (created_at, id) после каждого записанного
+# файла сохраняется в <out>/_state.json, повторный запуск продолжает с него. Берутся только
+# строки старше now() - --safety-lag-hours: журнал (spool.py) досылает события с исходным,
+# более ранним created_at, и без запаса они оказались бы позади водяного знака навсегда.
+# Запас должен быть больше, чем строка может пролежать в журнале.
+#
+# sessions / durations — строки меняются после вставки (last_seen, seconds), водяной знак
+# по created_at эти изменения не увидит. Они каждый раз выгружаются целиком (снимок) в
+# <out>/<table>.tmp и атомарно подменяют <out>/<table>.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from storage import SQLiteStorage, SupabaseStorage  # noqa: E402
+
+TABLES = {
+    "events": "id,created_at,visitor_id,session_id,page,event_type,meta",
+    "sessions": "id,created_at,visitor_id,session_id,last_seen",
+    "durations": "id,created_at,session_id,page,seconds",
+    "votes": "id,created_at,choice,voter_id",
+}
+KEYS = ("created_at", "id")
+# Таблицы, строки которых обновляются после вставки: только полный снимок
+MUTABLE = {"sessions", "durations"}
+
+
+class State:
+    """Водяные знаки по таблицам в JSON; запись атомарная (tmp + replace)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+    def get(self, table: str):
+        wm = self.data.get(table)
+        return tuple(wm) if wm else None
+
+    def set(self, table: str, wm: tuple):
+        with self._lock:
+            self.data[table] = list(wm)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.data, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+def _write_parts(root: Path, rows: list) -> int:
+    df = pd.DataFrame.from_records(rows)
+    day = pd.to_datetime(df["created_at"], utc=True, format="ISO8601").dt.strftime("%Y-%m-%d")
+    for d, part in df.groupby(day, sort=False):
+        target = root / f"date={d}"
+        target.mkdir(parents=True, exist_ok=True)
+        part.to_parquet(target / f"part-{int(part['id'].iloc[0]):012d}.parquet", index=False)
+    return len(df)
+
+
+def _swap(tmp: Path, final: Path):
+    """Готовый снимок tmp встаёт на место final; читатели видят либо старый, либо новый целиком."""
+    old = final.with_name(final.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if final.exists():
+        final.rename(old)
+    tmp.rename(final)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def export_table(storage, table: str, out: Path, state: State, page_size: int, rows_per_file: int,
+                 until: str) -> dict:
+    t0 = time.perf_counter()
+    snapshot = table in MUTABLE
+    if snapshot:
+        root = out / f"{table}.tmp"
+        shutil.rmtree(root, ignore_errors=True)
+        root.mkdir(parents=True)
+        after, until = None, None
+    else:
+        root = out / table
+        after = state.get(table)
+    buf, total = [], 0
+
+    def flush():
+        nonlocal buf, total
+        if buf:
+            total += _write_parts(root, buf)
+            if not snapshot:
+                state.set(table, tuple(buf[-1][k] for k in KEYS))
+            buf = []
+
+    while True:
+        rows = storage.fetch_after(table, TABLES[table], KEYS, after, page_size, until=until)
+        if not rows:
+            break
+        buf.extend(rows)
+        after = tuple(rows[-1][k] for k in KEYS)
+        if len(buf) >= rows_per_file:
+            flush()
+        if len(rows) < page_size:
+            break
+    flush()
+    if snapshot:
+        _swap(root, out / table)
+    secs = time.perf_counter() - t0
+    return {"table": table, "mode": "snapshot" if snapshot else "incremental", "rows": total,
+            "seconds": round(secs, 3), "rows_per_s": round(total / secs, 1) if secs else 0.0,
+            "watermark": state.get(table)}
+
+
+def _open_storage(args):
+    if args.sqlite:
+        return SQLiteStorage(args.sqlite)
+    from resources import SupabasePool
+    return SupabaseStorage(SupabasePool(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"],
+                                        health_interval=3600))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default="export")
+    ap.add_argument("--tables", default=",".join(TABLES))
+    ap.add_argument("--sqlite", help="путь к базе SQLiteStorage вместо Supabase")
+    ap.add_argument("--page-size", type=int, default=1000, help="строк за запрос (≤ max-rows PostgREST)")
+    ap.add_argument("--rows-per-file", type=int, default=100_000)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--safety-lag-hours", type=float, default=6.0,
+                    help="не выгружать events/votes моложе этого: их ещё может дослать журнал")
+    args = ap.parse_args()
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    state = State(out / "_state.json")
+    storage = _open_storage(args)
+    tables = [t for t in args.tables.split(",") if t]
+    until = (datetime.now(timezone.utc) - timedelta(hours=args.safety_lag_hours)).isoformat(timespec="seconds")
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:
+        results = list(ex.map(
+            lambda t: export_table(storage, t, out, state, args.page_size, args.rows_per_file, until), tables))
+    wall = time.perf_counter() - t0
+    rows = sum(r["rows"] for r in results)
+    print(json.dumps({"tables": results, "until": until, "rows": rows, "seconds": round(wall, 3),
+                      "rows_per_s": round(rows / wall, 1) if wall else 0.0}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
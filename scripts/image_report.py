@@ -0,0 +1,61 @@
+# image_report.py — сколько байт экономят варианты images.py против исходных PNG из assets/
+#
+#   python scripts/image_report.py
+#   python scripts/image_report.py --viewport 1280 --dpr 2
+#
+# Для каждой картинки: размер исходника, каждого варианта (ширина × формат) и время сборки.
+# «served» — что реально скачает браузер с окном --viewport и плотностью --dpr: наименьший
+# вариант не уже viewport × dpr в лучшем доступном формате — против исходного PNG,
+# который раньше уходил целиком.
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from images import ImageVariants  # noqa: E402
+
+ASSETS = Path(__file__).resolve().parents[1] / "assets"
+
+
+def report(variants: ImageVariants, path: Path, target: int) -> dict:
+    t0 = time.perf_counter()
+    variants.warm([path])
+    build_s = time.perf_counter() - t0
+    original = path.stat().st_size
+    rows = []
+    for w in variants.widths_for(path):
+        for fmt in variants.formats:
+            n = len(variants.get(path, w, fmt))
+            rows.append({"width": w, "format": fmt, "bytes": n, "saved": round(1 - n / original, 3)})
+    best_w = variants.best_width(path, target)
+    fmt = variants.formats[0] if variants.formats else "png"
+    served = len(variants.get(path, best_w, fmt))
+    return {"file": path.name, "size": list(variants.size(path)), "original_bytes": original,
+            "build_s": round(build_s, 3), "variants": rows,
+            "served": {"width": best_w, "format": fmt, "bytes": served,
+                       "saved": round(1 - served / original, 3)}}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--assets", default=str(ASSETS))
+    ap.add_argument("--viewport", type=int, default=1280, help="ширина слота картинки, CSS px")
+    ap.add_argument("--dpr", type=float, default=1.0, help="devicePixelRatio")
+    args = ap.parse_args()
+
+    variants = ImageVariants(max_bytes=1 << 30)
+    paths = sorted(Path(args.assets).glob("*.png"))
+    files = [report(variants, p, int(args.viewport * args.dpr)) for p in paths]
+    original = sum(f["original_bytes"] for f in files)
+    served = sum(f["served"]["bytes"] for f in files)
+    print(json.dumps({"formats": list(variants.formats), "files": files, "original_bytes": original,
+                      "served_bytes": served, "saved": round(1 - served / original, 3) if original else 0.0},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
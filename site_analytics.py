@@ -0,0 +1,200 @@
+# site_analytics.py — встроенная аналитика сайта: инкрементальные pandas-агрегаты по events/sessions
+
+import threading
+import time
+
+import pandas as pd
+
+CTA_EVENTS = ("tg_click", "gh_click", "resume_click")
+CTA_PAGE = "Главная"   # где живут CTA-кнопки — знаменатель CTR
+SESSION_BINS = (0, 10, 30, 60, 180, 600, 1800, float("inf"))
+SESSION_LABELS = ("<10 с", "10–30 с", "30 с–1 мин", "1–3 мин", "3–10 мин", "10–30 мин", "30+ мин")
+
+
+def _to_ts(s: pd.Series) -> pd.Series:
+    return pd.to_datetime(s, utc=True, format="ISO8601")
+
+
+class SiteAnalytics:
+    """
+    Агрегаты для раздела «Как пользуются моим сайтом», общие для всех сессий.
+
+    refresh() дочитывает только новые строки по водяным знакам: events — по id,
+    sessions — по (last_seen, id), чтобы подхватывать и продлённые сессии.
+    Сырые события не хранятся: каждая пачка сразу сворачивается векторно
+    в пары (день, посетитель), счётчики просмотров и CTA-кликов по дням.
+
+    Дни до горизонта свёртки (scripts/compact_events.py) берутся из events_daily,
+    а не из сырых событий: при сдвиге горизонта агрегаты перечитываются
+    (это небольшая таблица), а сырые счётчики за эти дни отбрасываются.
+
+    Память ограничена окном settle_days: пары (день, посетитель) старше окна
+    сворачиваются в число посетителей за день, а сессии, не продлевавшиеся дольше
+    окна, — в счётчики корзин длительности. Догоняющие события за свёрнутые дни
+    и «воскресшие» после окна сессии учитываются приближённо (могут задвоиться).
+    """
+
+    def __init__(self, storage, *, page_size: int = 5000, min_interval: float = 60.0,
+                 settle_days: float = 2.0):
+        self._db = storage
+        self.page_size = page_size
+        self.min_interval = min_interval
+        self.settle = pd.Timedelta(days=settle_days)
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._refreshed_at = float("-inf")
+        self._events_wm = None
+        self._sessions_wm = None
+        self._daily_visitors = pd.DataFrame({"day": pd.Series(dtype="datetime64[ns, UTC]"),
+                                             "visitor_id": pd.Series(dtype="object")})
+        empty_idx = pd.MultiIndex.from_arrays([pd.DatetimeIndex([], tz="UTC"), []], names=["day", "key"])
+        self._views = pd.Series(index=empty_idx, dtype="int64")     # (day, page) -> n
+        self._cta = pd.Series(index=empty_idx, dtype="int64")       # (day, event_type) -> n
+        self._agg = pd.DataFrame(columns=["day", "page", "event_type", "n"])
+        self._horizon = None
+        self._sessions = pd.DataFrame({"created_at": pd.Series(dtype="datetime64[ns, UTC]"),
+                                       "last_seen": pd.Series(dtype="datetime64[ns, UTC]")})
+        self._dau_settled = pd.Series(index=pd.DatetimeIndex([], tz="UTC", name="day"), dtype="int64")
+        self._lengths_settled = pd.Series(0, index=list(SESSION_LABELS), dtype="int64")
+        self.rows_read = {"events": 0, "sessions": 0}
+
+    @property
+    def loaded(self) -> bool:
+        """Первая загрузка завершена (до неё графики строятся по уже прочитанной части)."""
+        return self._refreshed_at > float("-inf")
+
+    # --- загрузка ---
+    def refresh(self, force: bool = False) -> bool:
+        """Дочитать новые строки (не чаще min_interval). False — пропущено."""
+        if not force and time.monotonic() - self._refreshed_at < self.min_interval:
+            return False
+        if not self._refreshing.acquire(blocking=False):
+            return False   # другая сессия уже обновляет — рисуем текущие данные
+        try:
+            self._sync_compaction()
+            self._pull("events", "id,created_at,visitor_id,page,event_type", ("id",), self._ingest_events)
+            self._pull("sessions", "id,session_id,created_at,last_seen", ("last_seen", "id"),
+                       self._ingest_sessions)
+            self._settle()
+            self._refreshed_at = time.monotonic()
+            return True
+        finally:
+            self._refreshing.release()
+
+    def _pull(self, table, columns, keys, ingest):
+        wm_attr = f"_{table}_wm"
+        while True:
+            rows = self._db.fetch_after(table, columns, keys, getattr(self, wm_attr), self.page_size)
+            if not rows:
+                return
+            ingest(pd.DataFrame.from_records(rows))
+            setattr(self, wm_attr, tuple(rows[-1][k] for k in keys))
+            self.rows_read[table] += len(rows)
+            if len(rows) < self.page_size:
+                return
+
+    def _sync_compaction(self):
+        raw = self._db.compaction_horizon()
+        horizon = pd.Timestamp(raw, tz="UTC") if raw else None
+        if horizon == self._horizon:
+            return
+        rows, after = [], None
+        while True:
+            page = self._db.fetch_after("events_daily", "day,page,event_type,n",
+                                        ("day", "page", "event_type"), after, self.page_size)
+            rows.extend(page)
+            if len(page) < self.page_size:
+                break
+            after = tuple(page[-1][k] for k in ("day", "page", "event_type"))
+        agg = pd.DataFrame.from_records(rows, columns=["day", "page", "event_type", "n"])
+        agg["day"] = pd.to_datetime(agg["day"], utc=True)
+        agg = agg[agg["day"] < horizon].astype({"n": "int64"})
+        with self._lock:
+            self._agg = agg
+            self._horizon = horizon
+            # Эти дни теперь целиком в агрегатах — сырые счётчики за них не нужны
+            self._daily_visitors = self._daily_visitors[self._daily_visitors["day"] >= horizon]
+            self._dau_settled = self._dau_settled[self._dau_settled.index >= horizon]
+            self._views = self._views[self._views.index.get_level_values("day") >= horizon]
+            self._cta = self._cta[self._cta.index.get_level_values("day") >= horizon]
+
+    def _ingest_events(self, df: pd.DataFrame):
+        df = df.assign(day=_to_ts(df["created_at"]).dt.floor("D"))
+        if self._horizon is not None:
+            df = df[df["day"] >= self._horizon]   # догоняющие события старых дней посчитает свёртка
+        visitors = df[["day", "visitor_id"]].dropna().drop_duplicates()
+        views = df[df["event_type"] == "page_view"].groupby(["day", "page"]).size()
+        clicks = df[df["event_type"].isin(CTA_EVENTS)].groupby(["day", "event_type"]).size()
+        views.index.names = clicks.index.names = ["day", "key"]
+        with self._lock:
+            self._daily_visitors = pd.concat([self._daily_visitors, visitors], ignore_index=True) \
+                .drop_duplicates()
+            self._views = self._views.add(views, fill_value=0).astype("int64")
+            self._cta = self._cta.add(clicks, fill_value=0).astype("int64")
+
+    def _settle(self):
+        cutoff = pd.Timestamp.now(tz="UTC") - self.settle
+        with self._lock:
+            old = self._daily_visitors["day"] < cutoff.floor("D")
+            if old.any():
+                counts = self._daily_visitors[old].groupby("day").size()
+                self._dau_settled = self._dau_settled.add(counts, fill_value=0).astype("int64")
+                self._daily_visitors = self._daily_visitors[~old]
+            done = self._sessions["last_seen"] < cutoff
+            if done.any():
+                self._lengths_settled = self._lengths_settled.add(
+                    _length_bins(self._sessions[done]), fill_value=0).astype("int64")
+                self._sessions = self._sessions[~done]
+
+    def _ingest_sessions(self, df: pd.DataFrame):
+        fresh = pd.DataFrame({"created_at": _to_ts(df["created_at"]), "last_seen": _to_ts(df["last_seen"])})
+        fresh.index = df["session_id"]
+        with self._lock:
+            # Продлённые сессии приходят повторно — последняя версия строки побеждает
+            merged = pd.concat([self._sessions, fresh])
+            self._sessions = merged[~merged.index.duplicated(keep="last")]
+
+    # --- агрегаты (свёрнутые дни + сырые) ---
+    def _agg_by(self, event_types, column: str) -> pd.Series:
+        agg = self._agg[self._agg["event_type"].isin(event_types)]
+        return agg.groupby(column)["n"].sum()
+
+    def dau(self) -> pd.DataFrame:
+        with self._lock:
+            raw = self._daily_visitors.groupby("day").size()
+            settled = self._dau_settled
+            old = self._agg_by(["__visitors__"], "day")
+        out = pd.concat([old, settled, raw]).groupby(level=0).sum().astype("int64") \
+            .rename("visitors").rename_axis("day").reset_index()
+        # Пустые ряды теряют тип дат после concat — приводим явно
+        out["day"] = pd.to_datetime(out["day"], utc=True).dt.tz_localize(None)
+        return out
+
+    def page_views(self) -> pd.Series:
+        with self._lock:
+            raw = self._views.groupby(level="key").sum()
+            old = self._agg_by(["page_view"], "page")
+        views = pd.concat([old, raw]).groupby(level=0).sum().astype("int64")
+        return views[views.index != ""].sort_values(ascending=False)
+
+    def cta(self) -> pd.DataFrame:
+        views = self.page_views()
+        with self._lock:
+            raw = self._cta.groupby(level="key").sum()
+            old = self._agg_by(list(CTA_EVENTS), "event_type")
+        clicks = pd.concat([old, raw]).groupby(level=0).sum().reindex(list(CTA_EVENTS), fill_value=0)
+        base = int(views.get(CTA_PAGE, 0))
+        out = clicks.astype("int64").rename("clicks").rename_axis("event_type").to_frame()
+        out["ctr"] = out["clicks"] / base if base else 0.0
+        return out
+
+    def session_lengths(self) -> pd.Series:
+        with self._lock:
+            s, settled = self._sessions, self._lengths_settled
+        return (_length_bins(s) + settled).astype("int64")
+
+
+def _length_bins(s: pd.DataFrame) -> pd.Series:
+    seconds = (s["last_seen"] - s["created_at"]).dt.total_seconds().clip(lower=0)
+    cats = pd.cut(seconds, bins=list(SESSION_BINS), labels=list(SESSION_LABELS), right=False)
+    return cats.value_counts().reindex(list(SESSION_LABELS), fill_value=0).astype("int64")
@@ -0,0 +1,246 @@
+# spool.py — локальный write-ahead журнал аналитики (SQLite) + фоновый дренер в Supabase
+
+import atexit
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ops (
+    seq      INTEGER PRIMARY KEY AUTOINCREMENT,
+    op_key   TEXT NOT NULL UNIQUE,
+    kind     TEXT NOT NULL,
+    payload  TEXT NOT NULL,
+    created  REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS dead (
+    seq      INTEGER PRIMARY KEY,
+    op_key   TEXT NOT NULL,
+    kind     TEXT NOT NULL,
+    payload  TEXT NOT NULL,
+    created  REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    error    TEXT
+);
+"""
+
+# HTTP-статусы 4xx, которые всё же стоит повторять
+_RETRYABLE_STATUS = {408, 409, 425, 429}
+
+
+def is_permanent(e: Exception) -> bool:
+    """
+    Ошибка, которую повтор не исправит: данные/запрос плохие, а не бэкенд недоступен.
+    Postgres 22xxx (data exception) и 23xxx (integrity), ошибки запроса PostgREST
+    (PGRST1xx/2xx), HTTP 4xx, а также ошибки формы строки в самом sink.
+    """
+    if isinstance(e, (ValueError, TypeError, KeyError, sqlite3.IntegrityError, sqlite3.DataError)):
+        return True
+    code = str(getattr(e, "code", "") or "")
+    if code[:2] in ("22", "23") or code.startswith(("PGRST1", "PGRST2")):
+        return True
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in _RETRYABLE_STATUS
+
+
+class Spool:
+    """
+    Аналог EventWriter с тем же API (submit/flush/close/stats), но на диске.
+
+    submit() — один INSERT в локальный SQLite (WAL, synchronous=NORMAL), это
+    микросекунды и не зависит от доступности Supabase. Поток-дренер берёт
+    самые старые операции, группирует по kind и отдаёт в sink(kind, rows);
+    при ошибке — экспоненциальный backoff с джиттером, операции остаются в журнале.
+
+    Каждая строка получает op_key (ключ идемпотентности): повтор после
+    потерянного ответа не должен задваивать данные на стороне sink.
+    Внутри одного kind порядок строк (а значит и порядок для сессии) сохраняется;
+    между kind'ами порядок задаёт kinds_order (например, сессия раньше её событий).
+
+    Транзиентная ошибка (сеть, 5xx) — вся пачка остаётся в журнале, дренер ждёт
+    по backoff; операции, не прошедшие max_attempts раз, уходят в таблицу dead.
+    Постоянная ошибка (permanent(e), по умолчанию is_permanent) — пачка делится
+    пополам, пока плохие строки не останутся по одной: они сразу уходят в dead,
+    остальные доставляются, и дренер не стоит.
+    """
+
+    def __init__(self, path, sink, *, kinds_order=(), batch_size: int = 200,
+                 idle_interval: float = 1.0, base_backoff: float = 0.5, max_backoff: float = 60.0,
+                 max_attempts: int = 50, permanent=is_permanent, name: str = "spool-drainer"):
+        self._sink = sink
+        self._permanent = permanent
+        self._order = {k: i for i, k in enumerate(kinds_order)}
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._closed = False
+        self._backoff = 0.0
+        self._counters = {
+            "submitted": 0, "flushed": 0, "failed": 0, "dead": 0, "batches": 0,
+            "flush_ms_last": 0.0, "flush_ms_max": 0.0, "flush_ms_total": 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # --- API ---
+    def submit(self, kind: str, row: dict, *, op_key: str = None) -> bool:
+        key = op_key or row.get("op_key") or uuid.uuid4().hex
+        payload = json.dumps(dict(row, op_key=key), ensure_ascii=False, default=str)
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO ops (op_key, kind, payload, created) VALUES (?, ?, ?, ?)",
+                    (key, kind, payload, time.time()),
+                )
+            except sqlite3.Error:
+                log.exception("Spool: не удалось записать операцию %s", kind)
+                return False
+            self._counters["submitted"] += 1
+        self._idle.clear()
+        return True
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Будим дренер и ждём, пока журнал опустеет (при живом бэкенде)."""
+        self._idle.clear()
+        self._wake.set()
+        return self._idle.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._counters)
+            depth, oldest = self._db.execute("SELECT count(*), min(created) FROM ops").fetchone()
+        s["queue_depth"] = depth
+        s["oldest_age_s"] = time.time() - oldest if oldest else 0.0
+        s["backoff_s"] = self._backoff
+        s["flush_ms_avg"] = s["flush_ms_total"] / s["batches"] if s["batches"] else 0.0
+        return s
+
+    # --- дренер ---
+    def _run(self):
+        while True:
+            drained = self._drain_once()
+            if self._closed:
+                return
+            if drained is None:            # ошибка sink — ждём по backoff
+                self._backoff = min(self.max_backoff, max(self.base_backoff, self._backoff * 2))
+                delay = self._backoff * random.uniform(0.5, 1.0)
+            else:
+                self._backoff = 0.0
+                if drained:
+                    continue               # в журнале, возможно, ещё есть
+                self._idle.set()
+                delay = self.idle_interval
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def _drain_once(self):
+        """Сколько операций доставлено; None — если sink упал."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, kind, payload, attempts FROM ops ORDER BY seq LIMIT ?", (self.batch_size,)
+            ).fetchall()
+        if not rows:
+            return 0
+        grouped = {}
+        for seq, kind, payload, attempts in rows:
+            grouped.setdefault(kind, []).append((seq, json.loads(payload), attempts))
+
+        t0 = time.perf_counter()
+        done = 0
+        failed = False
+        for kind in sorted(grouped, key=lambda k: self._order.get(k, len(self._order))):
+            items = grouped[kind]
+            ok, dead, error = self._deliver(kind, items)
+            if ok:
+                self._delete(ok)
+                done += len(ok)
+            if dead:
+                log.warning("Spool: %s ×%d отклонено навсегда: %s", kind, len(dead), dead[0][1])
+                self._bury(dead)
+            if error is not None:
+                handled = set(ok) | {item[0] for item, _ in dead}
+                rest = [item for item in items if item[0] not in handled]
+                log.warning("Spool: %s ×%d не доставлено: %s", kind, len(rest), error)
+                self._on_failure(rest, repr(error))
+                failed = True
+                break                      # остальное — в следующий заход, порядок не нарушаем
+
+        ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            c = self._counters
+            c["flushed"] += done
+            c["batches"] += 1
+            c["flush_ms_last"] = ms
+            c["flush_ms_total"] += ms
+            c["flush_ms_max"] = max(c["flush_ms_max"], ms)
+        return None if failed else done
+
+    def _deliver(self, kind: str, items: list):
+        """-> (доставленные seq, [(item, ошибка)] в dead, транзиентная ошибка или None)."""
+        try:
+            self._sink(kind, [payload for _, payload, _ in items])
+            return [seq for seq, _, _ in items], [], None
+        except Exception as e:
+            if not self._permanent(e):
+                return [], [], e
+            if len(items) == 1:
+                return [], [(items[0], repr(e))], None
+        # Постоянная ошибка в пачке: половины по отдельности, слева направо (порядок сохраняется)
+        mid = len(items) // 2
+        ok, dead, error = self._deliver(kind, items[:mid])
+        if error is not None:
+            return ok, dead, error
+        ok2, dead2, error = self._deliver(kind, items[mid:])
+        return ok + ok2, dead + dead2, error
+
+    def _delete(self, seqs: list):
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("DELETE FROM ops WHERE seq = ?", [(s,) for s in seqs])
+            self._db.execute("COMMIT")
+
+    def _on_failure(self, items: list, error: str):
+        with self._lock:
+            self._counters["failed"] += len(items)
+            self._db.execute("BEGIN")
+            self._db.executemany("UPDATE ops SET attempts = attempts + 1 WHERE seq = ?",
+                                 [(seq,) for seq, _, _ in items])
+            self._db.execute("COMMIT")
+        self._bury([(item, error) for item in items if item[2] + 1 >= self.max_attempts])
+
+    def _bury(self, dead: list):
+        """[(item, ошибка)] -> таблица dead."""
+        if not dead:
+            return
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR REPLACE INTO dead SELECT seq, op_key, kind, payload, created, attempts, ? "
+                "FROM ops WHERE seq = ?", [(error, item[0]) for item, error in dead])
+            self._db.executemany("DELETE FROM ops WHERE seq = ?", [(item[0],) for item, _ in dead])
+            self._counters["dead"] += len(dead)
+            self._db.execute("COMMIT")
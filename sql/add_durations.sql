@@ -0,0 +1,31 @@
+-- add_durations: атомарное накопление секунд по (session_id, page) за один round trip.
+-- Вызывается из app.py пачкой: sb.rpc("add_durations", {"p_rows": [{session_id, page, seconds, op_key}, ...]})
+-- op_key — ключ идемпотентности из локального журнала (spool.py): строки, чей ключ
+-- уже есть в applied_ops (sql/op_keys.sql), повторно не применяются.
+
+create unique index if not exists durations_session_page_uidx
+    on public.durations (session_id, page);
+
+create or replace function public.add_durations(p_rows jsonb)
+returns void
+language sql
+as $$
+    with r as (
+        select * from jsonb_to_recordset(p_rows) as r(session_id uuid, page text, seconds int, op_key text)
+    ),
+    fresh as (
+        insert into public.applied_ops (op_key)
+        select op_key from r where op_key is not null
+        on conflict do nothing
+        returning op_key
+    )
+    insert into public.durations (session_id, page, seconds)
+    select r.session_id, r.page, sum(r.seconds)::int
+    from r
+    where r.seconds > 0 and (r.op_key is null or r.op_key in (select op_key from fresh))
+    group by r.session_id, r.page
+    on conflict (session_id, page)
+    do update set seconds = coalesce(public.durations.seconds, 0) + excluded.seconds;
+$$;
+
+grant execute on function public.add_durations(jsonb) to anon, authenticated;
@@ -0,0 +1,44 @@
+-- bootstrap: первая отрисовка «Аналитики сайта» за один round trip.
+-- Upsert сессии с last_seen (heartbeat), page_view и в ответ — голоса, has_voted и
+-- суммарное время по страницам:
+--   sb.rpc("bootstrap", {"p_session": {visitor_id, session_id}, "p_event": {...} | null,
+--                         "p_last_seen": ts}).execute().data
+--   -> {"counts": {"like": 10, ...}, "voted": true, "durations": {"Главная": 1234, ...}}
+-- Применять после sql/op_keys.sql (events.op_key) и sql/page_durations.sql.
+
+create or replace function public.bootstrap(p_session jsonb, p_event jsonb default null,
+                                            p_last_seen timestamptz default null)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_visitor public.sessions.visitor_id%type := p_session->>'visitor_id';
+    v_session public.sessions.session_id%type := p_session->>'session_id';
+    v_voter   public.votes.voter_id%type      := p_session->>'visitor_id';
+begin
+    insert into public.sessions as s (visitor_id, session_id, last_seen)
+    values (v_visitor, v_session, coalesce(p_last_seen, now()))
+    on conflict (session_id) do update
+        set visitor_id = excluded.visitor_id,
+            last_seen  = greatest(s.last_seen, excluded.last_seen);
+
+    -- op_key тот же, что ушёл бы в журнал (spool.py): повтор через журнал не задвоит событие
+    if p_event is not null then
+        insert into public.events (created_at, visitor_id, session_id, page, event_type, meta, op_key)
+        select coalesce(e.created_at, now()), e.visitor_id, e.session_id, e.page, e.event_type, e.meta, e.op_key
+        from jsonb_populate_record(null::public.events, p_event) e
+        on conflict (op_key) do nothing;
+    end if;
+
+    return jsonb_build_object(
+        'counts', coalesce((select jsonb_object_agg(c.choice, c.n)
+                            from (select choice, count(*) as n from public.votes group by choice) c),
+                           '{}'::jsonb),
+        'voted', exists (select 1 from public.votes where voter_id = v_voter),
+        'durations', coalesce((select jsonb_object_agg(page, seconds) from public.page_durations),
+                              '{}'::jsonb)
+    );
+end;
+$$;
+
+grant execute on function public.bootstrap(jsonb, jsonb, timestamptz) to anon, authenticated;
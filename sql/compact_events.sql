@@ -0,0 +1,100 @@
+-- Ретеншн: сырые events старше горизонта сворачиваются в дневные агрегаты и удаляются.
+-- Джоб: scripts/compact_events.py. Читатели (site_analytics.py) берут дни < compaction_state.horizon
+-- из events_daily, а более свежие — из сырых events.
+
+create table if not exists public.events_daily (
+    day        date   not null,
+    page       text   not null default '',   -- '' — событие без страницы
+    event_type text   not null,              -- '__visitors__' — уникальные посетители за день
+    n          bigint not null default 0,
+    primary key (day, page, event_type)
+);
+
+-- Пары (день, посетитель) для точного DAU по свёрнутым дням (в т.ч. при догоняющих событиях)
+create table if not exists public.daily_visitors (
+    day        date not null,
+    visitor_id text not null,
+    primary key (day, visitor_id)
+);
+
+create table if not exists public.compaction_state (
+    id      int primary key default 1 check (id = 1),
+    horizon date not null
+);
+
+create index if not exists events_created_idx on public.events (created_at, id);
+
+-- Одна порция: до p_limit событий старше p_before переносятся в агрегаты и удаляются
+-- в одной транзакции, поэтому повтор/обрыв не задваивает и не теряет счётчики.
+-- skip locked — не ждём строк, которые сейчас трогают живые запросы.
+-- Возвращает число перенесённых строк; -1 — блокировку держит другой джоб.
+-- 0 не значит «готово»: skip locked мог пропустить все оставшиеся строки —
+-- это проверяет finish_compaction.
+create or replace function public.compact_events(p_before date, p_limit int default 5000)
+returns int
+language plpgsql
+as $$
+declare
+    moved int;
+    days  date[];
+begin
+    -- Один джоб за раз: пересчёт __visitors__ ниже должен видеть все вставки в daily_visitors
+    if not pg_try_advisory_xact_lock(hashtext('compact_events')) then
+        return -1;
+    end if;
+
+    with chunk as (
+        delete from public.events e
+        where e.id in (
+            select id from public.events
+            where created_at < (p_before::timestamp at time zone 'utc')
+            order by id
+            limit p_limit
+            for update skip locked
+        )
+        returning (e.created_at at time zone 'utc')::date as day,
+                  coalesce(e.page, '') as page, e.event_type, e.visitor_id
+    ),
+    agg as (
+        insert into public.events_daily as d (day, page, event_type, n)
+        select day, page, event_type, count(*) from chunk group by day, page, event_type
+        on conflict (day, page, event_type) do update set n = d.n + excluded.n
+    ),
+    vis as (
+        insert into public.daily_visitors (day, visitor_id)
+        select distinct day, visitor_id from chunk where visitor_id is not null
+        on conflict do nothing
+    )
+    select count(*), array_agg(distinct day) into moved, days from chunk;
+
+    if moved > 0 then
+        insert into public.events_daily (day, page, event_type, n)
+        select day, '', '__visitors__', count(*) from public.daily_visitors
+        where day = any(days) group by day
+        on conflict (day, page, event_type) do update set n = excluded.n;
+    end if;
+    return moved;
+end;
+$$;
+
+-- Публикует горизонт, только если событий до p_before не осталось: тогда читатели
+-- могут брать эти дни из events_daily. false — что-то осталось (пропущено skip locked
+-- или вставлено позже), горизонт не тронут.
+drop function if exists public.finish_compaction(date);
+create function public.finish_compaction(p_before date)
+returns boolean
+language plpgsql
+as $$
+begin
+    if exists (select 1 from public.events
+               where created_at < (p_before::timestamp at time zone 'utc')) then
+        return false;
+    end if;
+    insert into public.compaction_state (id, horizon) values (1, p_before)
+    on conflict (id) do update
+        set horizon = greatest(public.compaction_state.horizon, excluded.horizon);
+    return true;
+end;
+$$;
+
+grant select on public.events_daily, public.compaction_state to anon, authenticated;
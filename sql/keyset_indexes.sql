@@ -0,0 +1,10 @@
+-- Индексы под keyset-пагинацию fetch_after (storage.py): выгрузка scripts/export_parquet.py
+-- идёт по (created_at, id), SiteAnalytics дочитывает сессии по (last_seen, id).
+-- Запрос страницы — first_key >= X and (first_key > X or (first_key = X and id > Y))
+-- order by first_key, id limit n: по такому индексу это seek + n строк, а не скан с начала.
+-- events (created_at, id) создаётся в sql/compact_events.sql.
+
+create index if not exists sessions_created_idx   on public.sessions  (created_at, id);
+create index if not exists sessions_last_seen_idx on public.sessions  (last_seen, id);
+create index if not exists durations_created_idx  on public.durations (created_at, id);
+create index if not exists votes_created_idx      on public.votes     (created_at, id);
@@ -0,0 +1,14 @@
+-- Ключи идемпотентности для повторов из локального журнала (spool.py).
+-- Применять до sql/add_durations.sql.
+
+-- events: повтор пачки через upsert(on_conflict="op_key", ignore_duplicates=True)
+alter table public.events add column if not exists op_key text;
+create unique index if not exists events_op_key_uidx on public.events (op_key);
+
+-- applied_ops: какие инкрементные операции (add_durations) уже применены.
+-- Ключи нужны лишь на время возможных повторов — старые можно чистить:
+--   delete from public.applied_ops where applied_at < now() - interval '7 days';
+create table if not exists public.applied_ops (
+    op_key     text primary key,
+    applied_at timestamptz not null default now()
+);
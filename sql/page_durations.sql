@@ -0,0 +1,36 @@
+-- page_durations: агрегат «суммарное время по странице», поддерживается триггером
+-- на durations. Панель «Ваше время на страницах» читает 5 строк вместо всей durations.
+
+create table if not exists public.page_durations (
+    page    text primary key,
+    seconds bigint not null default 0
+);
+
+create or replace function public.page_durations_apply()
+returns trigger
+language plpgsql
+as $$
+declare
+    delta bigint := coalesce(new.seconds, 0)
+                  - case when tg_op = 'UPDATE' then coalesce(old.seconds, 0) else 0 end;
+begin
+    if delta <> 0 and new.page is not null then
+        insert into public.page_durations as pd (page, seconds)
+        values (new.page, delta)
+        on conflict (page) do update set seconds = pd.seconds + excluded.seconds;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists durations_rollup on public.durations;
+create trigger durations_rollup
+    after insert or update of seconds on public.durations
+    for each row execute function public.page_durations_apply();
+
+-- Разовый бэкфилл по уже накопленным строкам
+insert into public.page_durations (page, seconds)
+select page, sum(coalesce(seconds, 0)) from public.durations where page is not null group by page
+on conflict (page) do update set seconds = excluded.seconds;
+
+grant select on public.page_durations to anon, authenticated;
@@ -0,0 +1,19 @@
+-- touch_sessions: heartbeat'ы пачкой, у каждой сессии своё last_seen (одним UPDATE ... FROM).
+-- Вызов: sb.rpc("touch_sessions", {"p_rows": [{"session_id": ..., "last_seen": ...}, ...]})
+-- greatest(): повтор старой пачки из журнала (spool.py) не откатывает last_seen назад.
+
+create or replace function public.touch_sessions(p_rows jsonb)
+returns void
+language sql
+as $$
+    update public.sessions s
+    set last_seen = greatest(s.last_seen, r.last_seen)
+    from (
+        select session_id, max(last_seen) as last_seen
+        from jsonb_populate_recordset(null::public.sessions, p_rows)
+        group by session_id
+    ) r
+    where s.session_id = r.session_id;
+$$;
+
+grant execute on function public.touch_sessions(jsonb) to anon, authenticated;
@@ -0,0 +1,14 @@
+-- vote_counts: лайки и дизлайки одним запросом (вместо двух count="exact" head-запросов).
+-- Вызов: sb.rpc("vote_counts").execute().data -> [{"choice": "like", "n": 10}, ...]
+
+create index if not exists votes_choice_idx on public.votes (choice);
+
+create or replace function public.vote_counts()
+returns table (choice text, n bigint)
+language sql
+stable
+as $$
+    select v.choice, count(*) from public.votes v group by v.choice;
+$$;
+
+grant execute on function public.vote_counts() to anon, authenticated;
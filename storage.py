@@ -0,0 +1,626 @@
+# storage.py — слой хранения аналитики: votes / sessions / events / durations
+#
+# Storage — общий интерфейс, которым пользуется app.py. Реализации:
+#   SupabaseStorage — PostgREST через SupabasePool (resources.py), продакшен;
+#   SQLiteStorage   — локальный файл/память: офлайн-запуск, бенчмарки, маленький single-node деплой.
+
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DuplicateVote(Exception):
+    """Посетитель уже голосовал (сработал уникальный индекс по voter_id)."""
+
+
+# compact_events(): advisory lock держит другой джоб свёртки
+COMPACTION_BUSY = -1
+
+
+def _strip_op_keys(rows: list) -> list:
+    return [{k: v for k, v in r.items() if k != "op_key"} for r in rows]
+
+
+def _keyset_filter(keys: tuple, after: tuple) -> str:
+    """PostgREST or=(...) для (k1, k2, ...) > (v1, v2, ...)."""
+    parts, eqs = [], []
+    for k, v in zip(keys, after):
+        cond = f'{k}.gt."{v}"'
+        parts.append(f"and({','.join(eqs + [cond])})" if eqs else cond)
+        eqs.append(f'{k}.eq."{v}"')
+    return ",".join(parts)
+
+
+class Storage(ABC):
+    """
+    Интерфейс хранилища. Пишущие методы принимают пачки строк (как их копит
+    фоновый писатель) и должны быть идемпотентны при повторе той же пачки:
+    события и инкременты durations несут op_key.
+    """
+
+    # --- votes ---
+    @abstractmethod
+    def add_vote(self, voter_id: str, choice: str):
+        """Записать голос; DuplicateVote — если voter_id уже голосовал."""
+
+    @abstractmethod
+    def upsert_votes(self, rows: list):
+        """Дослать голоса из журнала; уже записанные молча пропускаются."""
+
+    @abstractmethod
+    def has_voted(self, voter_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def vote_counts(self) -> dict:
+        """{"like": n, "dislike": m} одним запросом."""
+
+    # --- sessions / events / durations ---
+    @abstractmethod
+    def upsert_sessions(self, rows: list):
+        ...
+
+    @abstractmethod
+    def touch_sessions(self, rows: list):
+        """last_seen по [{session_id, last_seen}] — у каждой сессии своё время, назад не откатывается."""
+
+    @abstractmethod
+    def insert_events(self, rows: list):
+        ...
+
+    @abstractmethod
+    def add_durations(self, rows: list):
+        """Атомарный инкремент seconds по (session_id, page)."""
+
+    @abstractmethod
+    def page_durations(self) -> dict:
+        """Суммарные секунды по страницам (агрегат, а не скан durations)."""
+
+    # --- первая отрисовка страницы (sql/bootstrap.sql) ---
+    def bootstrap(self, session: dict, event: dict = None, last_seen: str = None) -> dict:
+        """
+        Upsert сессии {visitor_id, session_id} с last_seen, page_view event (если передан,
+        с op_key) и в ответ — {"counts": vote_counts(), "voted": has_voted(visitor_id),
+        "durations": page_durations()}. Базовая версия собирает это из обычных методов;
+        бэкенды делают всё за один round trip.
+        """
+        self._bootstrap_writes(session, event, last_seen)
+        return {"counts": self.vote_counts(), "voted": self.has_voted(session["visitor_id"]),
+                "durations": self.page_durations()}
+
+    def _bootstrap_writes(self, session, event, last_seen):
+        self.upsert_sessions([session])
+        if last_seen:
+            self.touch_sessions([{"session_id": session["session_id"], "last_seen": last_seen}])
+        if event:
+            self.insert_events([event])
+
+    # --- инкрементальное чтение ---
+    @abstractmethod
+    def fetch_after(self, table: str, columns: str, keys: tuple, after: tuple = None,
+                    limit: int = 1000, *, until=None) -> list:
+        """
+        Keyset-пагинация: до limit строк table, упорядоченных по keys, строго после
+        кортежа after (None — с начала). Строки с NULL в первом ключе пропускаются;
+        until — только строки с первым ключом строго меньше него.
+        """
+
+    # --- ретеншн (sql/compact_events.sql) ---
+    @abstractmethod
+    def compact_events(self, before: str, limit: int = 5000) -> int:
+        """
+        Свернуть до limit событий старше дня before (YYYY-MM-DD) в events_daily; сколько перенесено.
+        COMPACTION_BUSY — идёт другой джоб. 0 ещё не «готово» (строки могли быть заняты) —
+        см. finish_compaction.
+        """
+
+    @abstractmethod
+    def finish_compaction(self, before: str) -> bool:
+        """Опубликовать горизонт before, если событий до него не осталось; False — остались."""
+
+    @abstractmethod
+    def compaction_horizon(self):
+        """День (YYYY-MM-DD), до которого данные берутся из events_daily; None — свёртки не было."""
+
+    # --- служебное ---
+    def ping(self) -> bool:
+        return True
+
+    def mark_unhealthy(self):
+        """Подсказка от вызывающего кода: запрос упал, стоит проверить соединение."""
+
+    def write_batch(self, kind: str, rows: list):
+        """Диспетчер для фонового писателя: kind -> метод хранилища."""
+        if kind == "events":
+            self.insert_events(rows)
+        elif kind == "durations":
+            self.add_durations([r for r in rows if int(r["seconds"]) > 0])
+        elif kind == "sessions.upsert":
+            self.upsert_sessions(_strip_op_keys(rows))
+        elif kind == "votes":
+            self.upsert_votes(_strip_op_keys(rows))
+        elif kind == "sessions.touch":
+            # Последний heartbeat каждой сессии из пачки, со своим временем
+            latest = {}
+            for r in rows:
+                if r["last_seen"] > latest.get(r["session_id"], ""):
+                    latest[r["session_id"]] = r["last_seen"]
+            self.touch_sessions([{"session_id": sid, "last_seen": ts} for sid, ts in latest.items()])
+        else:
+            raise ValueError(f"unknown batch kind: {kind}")
+
+
+# ===========================
+# Supabase / PostgREST
+# ===========================
+class SupabaseStorage(Storage):
+    """
+    Хранилище поверх Supabase. Серверные функции и агрегаты — в sql/; пока они
+    не задеплоены, методы откатываются на прямые запросы к таблицам.
+    """
+
+    def __init__(self, client):
+        self.sb = client   # SupabasePool или обычный supabase.Client
+        # Общий пул для запасного bootstrap (без RPC); потоки создаются по требованию
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bootstrap")
+
+    @staticmethod
+    def _code(e: Exception):
+        return getattr(e, "code", None)
+
+    def add_vote(self, voter_id, choice):
+        try:
+            self.sb.table("votes").insert({"choice": choice, "voter_id": voter_id}).execute()
+        except Exception as e:
+            if self._code(e) == "23505":   # unique_violation
+                raise DuplicateVote(voter_id) from e
+            raise
+
+    def upsert_votes(self, rows):
+        self.sb.table("votes").upsert(rows, on_conflict="voter_id", ignore_duplicates=True).execute()
+
+    def has_voted(self, voter_id):
+        r = self.sb.table("votes").select("id").eq("voter_id", voter_id).limit(1).execute()
+        return bool(r.data)
+
+    def vote_counts(self):
+        try:
+            rows = self.sb.rpc("vote_counts").execute().data or []
+            return {r["choice"]: int(r["n"] or 0) for r in rows}
+        except Exception as e:
+            if self._code(e) != "PGRST202":   # RPC ещё не задеплоена (sql/vote_counts.sql)
+                raise
+        return {
+            c: self.sb.table("votes").select("id", count="exact", head=True).eq("choice", c).execute().count or 0
+            for c in ("like", "dislike")
+        }
+
+    def upsert_sessions(self, rows):
+        self.sb.table("sessions").upsert(rows, on_conflict="session_id").execute()
+
+    def touch_sessions(self, rows):
+        try:
+            self.sb.rpc("touch_sessions", {"p_rows": rows}).execute()
+            return
+        except Exception as e:
+            if self._code(e) != "PGRST202":   # RPC ещё не задеплоена (sql/touch_sessions.sql)
+                raise
+        # Без RPC: один UPDATE ... IN (...) на каждое значение last_seen
+        by_ts = {}
+        for r in rows:
+            by_ts.setdefault(r["last_seen"], []).append(r["session_id"])
+        for ts, ids in by_ts.items():
+            self.sb.table("sessions").update({"last_seen": ts}).in_("session_id", ids).execute()
+
+    def insert_events(self, rows):
+        # op_key (sql/op_keys.sql) делает повтор пачки идемпотентным
+        if all(r.get("op_key") for r in rows):
+            try:
+                self.sb.table("events").upsert(rows, on_conflict="op_key", ignore_duplicates=True).execute()
+                return
+            except Exception as e:
+                if self._code(e) not in ("PGRST204", "42703", "42P10"):   # колонки/индекса ещё нет
+                    raise
+        self.sb.table("events").insert(_strip_op_keys(rows)).execute()
+
+    def add_durations(self, rows):
+        """
+        Инкремент durations одним RPC (sql/add_durations.sql): upsert + seconds = seconds + x
+        на стороне Postgres, без гонок между вкладками. Строки с уже применённым op_key
+        функция пропускает, так что повтор пачки из журнала не задваивает секунды.
+        """
+        if not rows:
+            return
+        try:
+            self.sb.rpc("add_durations", {"p_rows": rows}).execute()
+            return
+        except Exception as e:
+            if self._code(e) != "PGRST202":   # PGRST202 — функции нет в схеме
+                raise
+        # Локальная замена, пока RPC не задеплоена: read-modify-write по одной строке.
+        # Корректно в пределах процесса — пачки пишет единственный поток-флашер.
+        # Перед инкрементом строка «занимает» свой op_key в applied_ops (upsert без дублей
+        # возвращает строку, только если ключ новый), при ошибке инкремента ключ освобождается:
+        # повтор пачки из журнала пропускает уже применённые строки и доприменяет остальные.
+        dedup = True
+        for r in rows:
+            key = r.get("op_key") if dedup else None
+            if key:
+                try:
+                    claimed = self.sb.table("applied_ops").upsert(
+                        {"op_key": key}, on_conflict="op_key", ignore_duplicates=True).execute().data
+                except Exception as e:
+                    if self._code(e) not in ("PGRST205", "42P01"):   # sql/op_keys.sql ещё не применён
+                        raise
+                    dedup, key, claimed = False, None, True
+                if not claimed:
+                    continue   # эту операцию уже применяли
+            try:
+                self._increment_duration(r["session_id"], r["page"], int(r["seconds"]))
+            except Exception:
+                if key:
+                    self.sb.table("applied_ops").delete().eq("op_key", key).execute()
+                raise
+
+    def _increment_duration(self, session_id: str, page: str, sec: int):
+        existing = self.sb.table("durations").select("seconds") \
+            .eq("session_id", session_id).eq("page", page).execute()
+        if existing.data:
+            cur = existing.data[0].get("seconds", 0) or 0
+            self.sb.table("durations").update({"seconds": cur + sec}) \
+                .eq("session_id", session_id).eq("page", page).execute()
+        else:
+            self.sb.table("durations").insert({"session_id": session_id, "page": page, "seconds": sec}).execute()
+
+    def page_durations(self):
+        try:
+            rows = self.sb.table("page_durations").select("page,seconds").execute().data or []
+            return {r["page"]: int(r.get("seconds") or 0) for r in rows}
+        except Exception as e:
+            if self._code(e) not in ("PGRST205", "42P01"):   # агрегата ещё нет (sql/page_durations.sql)
+                raise
+        totals = Counter()
+        for r in self.sb.table("durations").select("page,seconds").execute().data or []:
+            if r.get("page"):
+                totals[r["page"]] += int(r.get("seconds") or 0)
+        return dict(totals)
+
+    def bootstrap(self, session, event=None, last_seen=None):
+        try:
+            out = self.sb.rpc("bootstrap", {"p_session": session, "p_event": event,
+                                            "p_last_seen": last_seen}).execute().data or {}
+        except Exception as e:
+            if self._code(e) != "PGRST202":   # RPC ещё не задеплоена (sql/bootstrap.sql)
+                raise
+        else:
+            return {"counts": {k: int(v or 0) for k, v in (out.get("counts") or {}).items()},
+                    "voted": bool(out.get("voted")),
+                    "durations": {k: int(v or 0) for k, v in (out.get("durations") or {}).items()}}
+        # Без RPC: запись и три независимых чтения — параллельно, по соединениям пула
+        writes = self._pool.submit(self._bootstrap_writes, session, event, last_seen)
+        counts = self._pool.submit(self.vote_counts)
+        voted = self._pool.submit(self.has_voted, session["visitor_id"])
+        durations = self._pool.submit(self.page_durations)
+        writes.result()
+        return {"counts": counts.result(), "voted": voted.result(), "durations": durations.result()}
+
+    def fetch_after(self, table, columns, keys, after=None, limit=1000, *, until=None):
+        q = self.sb.table(table).select(columns).not_.is_(keys[0], "null")
+        if until is not None:
+            q = q.lt(keys[0], until)
+        for k in keys:
+            q = q.order(k)
+        if after is not None:
+            # gte по первому ключу — диапазон для индекса (sql/keyset_indexes.sql): один or=(...)
+            # Postgres в range scan не превращает, и каждая страница шла бы с начала таблицы
+            q = q.gte(keys[0], after[0]).or_(_keyset_filter(keys, after))
+        return q.limit(limit).execute().data or []
+
+    def compact_events(self, before, limit=5000):
+        return int(self.sb.rpc("compact_events", {"p_before": before, "p_limit": limit}).execute().data or 0)
+
+    def finish_compaction(self, before):
+        return bool(self.sb.rpc("finish_compaction", {"p_before": before}).execute().data)
+
+    def compaction_horizon(self):
+        try:
+            rows = self.sb.table("compaction_state").select("horizon").eq("id", 1).execute().data
+        except Exception as e:
+            if self._code(e) not in ("PGRST205", "42P01"):   # свёртку ещё не настраивали
+                raise
+            return None
+        return rows[0]["horizon"] if rows else None
+
+    def ping(self):
+        check = getattr(self.sb, "check", None)
+        if check is not None:
+            return check()
+        self.sb.table("votes").select("id").limit(1).execute()
+        return True
+
+    def mark_unhealthy(self):
+        hook = getattr(self.sb, "mark_unhealthy", None)
+        if hook is not None:
+            hook()
+
+
+# ===========================
+# SQLite (встроенный движок)
+# ===========================
+_NOW = "(strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))"
+
+SQLITE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS votes (
+    id         INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL DEFAULT {_NOW},
+    choice     TEXT NOT NULL CHECK (choice IN ('like', 'dislike')),
+    voter_id   TEXT NOT NULL UNIQUE                      -- 1 user = 1 vote
+);
+CREATE INDEX IF NOT EXISTS votes_choice_idx ON votes (choice);
+CREATE INDEX IF NOT EXISTS votes_created_idx ON votes (created_at, id);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    id         INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL DEFAULT {_NOW},
+    visitor_id TEXT NOT NULL,
+    session_id TEXT NOT NULL UNIQUE,
+    last_seen  TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_visitor_idx ON sessions (visitor_id);
+CREATE INDEX IF NOT EXISTS sessions_created_idx ON sessions (created_at, id);
+CREATE INDEX IF NOT EXISTS sessions_last_seen_idx ON sessions (last_seen, id);
+
+CREATE TABLE IF NOT EXISTS events (
+    id         INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL DEFAULT {_NOW},
+    visitor_id TEXT,
+    session_id TEXT,
+    page       TEXT,
+    event_type TEXT NOT NULL,
+    meta       TEXT,
+    op_key     TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS events_created_idx ON events (created_at, id);
+CREATE INDEX IF NOT EXISTS events_session_idx ON events (session_id);
+
+CREATE TABLE IF NOT EXISTS durations (
+    id         INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL DEFAULT {_NOW},
+    session_id TEXT NOT NULL,
+    page       TEXT NOT NULL,
+    seconds    INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (session_id, page)
+);
+CREATE INDEX IF NOT EXISTS durations_created_idx ON durations (created_at, id);
+
+CREATE TABLE IF NOT EXISTS page_durations (
+    page    TEXT PRIMARY KEY,
+    seconds INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS events_daily (
+    day        TEXT NOT NULL,
+    page       TEXT NOT NULL DEFAULT '',
+    event_type TEXT NOT NULL,                            -- '__visitors__' — уникальные посетители
+    n          INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, page, event_type)
+);
+
+CREATE TABLE IF NOT EXISTS daily_visitors (
+    day        TEXT NOT NULL,
+    visitor_id TEXT NOT NULL,
+    PRIMARY KEY (day, visitor_id)
+);
+
+CREATE TABLE IF NOT EXISTS compaction_state (
+    id      INTEGER PRIMARY KEY CHECK (id = 1),
+    horizon TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS applied_ops (
+    op_key     TEXT PRIMARY KEY,
+    applied_at TEXT NOT NULL DEFAULT {_NOW}
+);
+
+-- page_durations поддерживается триггерами, как и в Postgres (sql/page_durations.sql)
+CREATE TRIGGER IF NOT EXISTS durations_rollup_ins AFTER INSERT ON durations
+BEGIN
+    INSERT INTO page_durations (page, seconds) VALUES (NEW.page, NEW.seconds)
+    ON CONFLICT (page) DO UPDATE SET seconds = seconds + excluded.seconds;
+END;
+CREATE TRIGGER IF NOT EXISTS durations_rollup_upd AFTER UPDATE OF seconds ON durations
+BEGIN
+    INSERT INTO page_durations (page, seconds) VALUES (NEW.page, NEW.seconds - OLD.seconds)
+    ON CONFLICT (page) DO UPDATE SET seconds = seconds + excluded.seconds;
+END;
+"""
+
+
+class SQLiteStorage(Storage):
+    """
+    Встроенное хранилище на SQLite (WAL). Одно соединение на процесс под замком:
+    все запросы — константные строки с плейсхолдерами, sqlite3 держит их
+    скомпилированными в кэше соединения (prepared statements).
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None,
+                                   cached_statements=256)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(SQLITE_SCHEMA)
+        self._lock = threading.RLock()
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _tx(self, fn):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return out
+
+    # --- votes ---
+    def add_vote(self, voter_id, choice):
+        try:
+            self._query("INSERT INTO votes (choice, voter_id) VALUES (?, ?)", (choice, voter_id))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateVote(voter_id) from e
+
+    def upsert_votes(self, rows):
+        self._tx(lambda db: db.executemany(
+            "INSERT OR IGNORE INTO votes (choice, voter_id) VALUES (?, ?)",
+            [(r["choice"], r["voter_id"]) for r in rows]))
+
+    def has_voted(self, voter_id):
+        return bool(self._query("SELECT 1 FROM votes WHERE voter_id = ? LIMIT 1", (voter_id,)))
+
+    def vote_counts(self):
+        return dict(self._query("SELECT choice, count(*) FROM votes GROUP BY choice"))
+
+    # --- sessions / events / durations ---
+    def upsert_sessions(self, rows):
+        self._tx(lambda db: db.executemany(
+            "INSERT INTO sessions (visitor_id, session_id) VALUES (?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET visitor_id = excluded.visitor_id",
+            [(r["visitor_id"], r["session_id"]) for r in rows]))
+
+    def touch_sessions(self, rows):
+        self._tx(lambda db: db.executemany(
+            "UPDATE sessions SET last_seen = coalesce(max(last_seen, ?1), ?1) WHERE session_id = ?2",
+            [(r["last_seen"], r["session_id"]) for r in rows]))
+
+    def insert_events(self, rows):
+        self._tx(lambda db: db.executemany(
+            "INSERT OR IGNORE INTO events (created_at, visitor_id, session_id, page, event_type, meta, op_key) "
+            f"VALUES (coalesce(?, {_NOW}), ?, ?, ?, ?, ?, ?)",
+            [(r.get("created_at"), r.get("visitor_id"), r.get("session_id"), r.get("page"),
+              r["event_type"], r.get("meta"), r.get("op_key")) for r in rows]))
+
+    def add_durations(self, rows):
+        def apply(db):
+            for r in rows:
+                key = r.get("op_key")
+                if key is not None:
+                    db.execute("INSERT OR IGNORE INTO applied_ops (op_key) VALUES (?)", (key,))
+                    if db.execute("SELECT changes()").fetchone()[0] == 0:
+                        continue   # эту операцию уже применяли
+                db.execute(
+                    "INSERT INTO durations (session_id, page, seconds) VALUES (?, ?, ?) "
+                    "ON CONFLICT (session_id, page) DO UPDATE SET seconds = seconds + excluded.seconds",
+                    (r["session_id"], r["page"], int(r["seconds"])))
+        if rows:
+            self._tx(apply)
+
+    def page_durations(self):
+        return dict(self._query("SELECT page, seconds FROM page_durations"))
+
+    def bootstrap(self, session, event=None, last_seen=None):
+        # Запись и чтения — одной транзакцией под одним захватом соединения
+        def apply(db):
+            db.execute(
+                "INSERT INTO sessions (visitor_id, session_id, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET visitor_id = excluded.visitor_id, "
+                "last_seen = coalesce(max(last_seen, excluded.last_seen), last_seen, excluded.last_seen)",
+                (session["visitor_id"], session["session_id"], last_seen))
+            if event:
+                db.execute(
+                    "INSERT OR IGNORE INTO events (created_at, visitor_id, session_id, page, event_type, meta, op_key) "
+                    f"VALUES (coalesce(?, {_NOW}), ?, ?, ?, ?, ?, ?)",
+                    (event.get("created_at"), event.get("visitor_id"), event.get("session_id"), event.get("page"),
+                     event["event_type"], event.get("meta"), event.get("op_key")))
+            return {
+                "counts": dict(db.execute("SELECT choice, count(*) FROM votes GROUP BY choice").fetchall()),
+                "voted": db.execute("SELECT 1 FROM votes WHERE voter_id = ? LIMIT 1",
+                                    (session["visitor_id"],)).fetchone() is not None,
+                "durations": dict(db.execute("SELECT page, seconds FROM page_durations").fetchall()),
+            }
+        return self._tx(apply)
+
+    # Имена таблиц/колонок подставляются в SQL — только из белого списка схемы
+    _COLUMNS = {
+        "votes": {"id", "created_at", "choice", "voter_id"},
+        "sessions": {"id", "created_at", "visitor_id", "session_id", "last_seen"},
+        "events": {"id", "created_at", "visitor_id", "session_id", "page", "event_type", "meta", "op_key"},
+        "durations": {"id", "created_at", "session_id", "page", "seconds"},
+        "events_daily": {"day", "page", "event_type", "n"},
+    }
+
+    def fetch_after(self, table, columns, keys, after=None, limit=1000, *, until=None):
+        cols = [c.strip() for c in columns.split(",")]
+        allowed = self._COLUMNS.get(table, set())
+        if not set(cols) | set(keys) <= allowed:
+            raise ValueError(f"unknown columns for {table}: {columns} / {keys}")
+        key_sql = ", ".join(keys)
+        sql = f"SELECT {', '.join(cols)} FROM {table} WHERE {keys[0]} IS NOT NULL"
+        params = []
+        if after is not None:
+            sql += f" AND {keys[0]} >= ? AND ({key_sql}) > ({', '.join('?' * len(keys))})"
+            params.extend((after[0], *after))
+        if until is not None:
+            sql += f" AND {keys[0]} < ?"
+            params.append(until)
+        sql += f" ORDER BY {key_sql} LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            cur = self._db.execute(sql, params)
+            names = [d[0] for d in cur.description]
+            return [dict(zip(names, row)) for row in cur.fetchall()]
+
+    def compact_events(self, before, limit=5000):
+        # Та же логика, что в sql/compact_events.sql, одной транзакцией
+        def apply(db):
+            db.execute("CREATE TEMP TABLE IF NOT EXISTS _chunk (id INTEGER, day TEXT, page TEXT, "
+                       "event_type TEXT, visitor_id TEXT)")
+            db.execute("DELETE FROM _chunk")
+            db.execute(
+                "INSERT INTO _chunk SELECT id, substr(created_at, 1, 10), coalesce(page, ''), event_type, visitor_id "
+                "FROM events WHERE created_at < ? ORDER BY id LIMIT ?", (before, limit))
+            moved = db.execute("SELECT count(*) FROM _chunk").fetchone()[0]
+            if not moved:
+                return 0
+            db.execute(
+                "INSERT INTO events_daily (day, page, event_type, n) "
+                "SELECT day, page, event_type, count(*) FROM _chunk WHERE true GROUP BY day, page, event_type "
+                "ON CONFLICT (day, page, event_type) DO UPDATE SET n = n + excluded.n")
+            db.execute("INSERT OR IGNORE INTO daily_visitors (day, visitor_id) "
+                       "SELECT DISTINCT day, visitor_id FROM _chunk WHERE visitor_id IS NOT NULL")
+            db.execute(
+                "INSERT INTO events_daily (day, page, event_type, n) "
+                "SELECT day, '', '__visitors__', count(*) FROM daily_visitors "
+                "WHERE day IN (SELECT DISTINCT day FROM _chunk) GROUP BY day "
+                "ON CONFLICT (day, page, event_type) DO UPDATE SET n = excluded.n")
+            db.execute("DELETE FROM events WHERE id IN (SELECT id FROM _chunk)")
+            return moved
+        return self._tx(apply)
+
+    def finish_compaction(self, before):
+        def apply(db):
+            if db.execute("SELECT 1 FROM events WHERE created_at < ? LIMIT 1", (before,)).fetchone():
+                return False
+            db.execute(
+                "INSERT INTO compaction_state (id, horizon) VALUES (1, ?) "
+                "ON CONFLICT (id) DO UPDATE SET horizon = max(horizon, excluded.horizon)", (before,))
+            return True
+        return self._tx(apply)
+
+    def compaction_horizon(self):
+        rows = self._query("SELECT horizon FROM compaction_state WHERE id = 1")
+        return rows[0][0] if rows else None
+
+    def ping(self):
+        self._query("SELECT 1")
+        return True
+
+    def close(self):
+        with self._lock:
+            self._db.close()
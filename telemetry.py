@@ -0,0 +1,201 @@
+# telemetry.py — фоновая запись аналитики (events и др.) пачками, вне ререндера Streamlit
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class EventWriter:
+    """
+    Процесс-глобальный писатель: submit() кладёт строку в очередь и сразу
+    возвращается, поток-флашер отправляет накопленное пачкой через sink(kind, rows).
+
+    Флаш срабатывает по размеру (batch_size) или по времени (flush_interval).
+    Очередь ограничена (max_queue): при переполнении submit ждёт put_timeout,
+    затем строка отбрасывается и учитывается в счётчике dropped.
+    """
+
+    def __init__(self, sink, *, batch_size: int = 50, flush_interval: float = 2.0,
+                 max_queue: int = 10_000, put_timeout: float = 0.05, name: str = "event-writer"):
+        self._sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._q = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._flush_waiters = deque()
+        self._closed = False
+        self._counters = {
+            "submitted": 0, "flushed": 0, "dropped": 0, "failed": 0, "batches": 0,
+            "flush_ms_last": 0.0, "flush_ms_max": 0.0, "flush_ms_total": 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # --- API ---
+    def submit(self, kind: str, row: dict) -> bool:
+        """Неблокирующая (почти) постановка строки в очередь. False — строка отброшена."""
+        if self._closed:
+            return False
+        try:
+            self._q.put((kind, row), timeout=self.put_timeout)
+        except queue.Full:
+            self._bump("dropped")
+            return False
+        self._bump("submitted")
+        return True
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Просим флашер отправить всё, что есть, и ждём завершения."""
+        done = threading.Event()
+        with self._lock:
+            self._flush_waiters.append(done)
+        try:
+            self._q.put_nowait(None)   # будим флашер
+        except queue.Full:
+            pass
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """Досылаем хвост очереди и останавливаем поток (вызывается и из atexit)."""
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._counters)
+        s["queue_depth"] = self._q.qsize()
+        s["flush_ms_avg"] = s["flush_ms_total"] / s["batches"] if s["batches"] else 0.0
+        return s
+
+    # --- внутреннее ---
+    def _bump(self, key: str, n: int = 1):
+        with self._lock:
+            self._counters[key] += n
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            stop = item is _STOP
+            if item is not None and not stop:
+                batch.append(item)
+            forced = item is None and self._flush_waiters
+            if stop or forced or len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if stop or forced:
+                    rest, saw_stop = self._drain_nowait()
+                    batch.extend(rest)
+                    stop = stop or saw_stop
+                if batch:
+                    self._send(batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval
+                if stop or forced or self._q.empty():
+                    self._release_waiters()
+            if stop:
+                return
+
+    def _drain_nowait(self):
+        out, saw_stop = [], False
+        while True:
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                return out, saw_stop
+            if item is _STOP:
+                saw_stop = True
+            elif item is not None:
+                out.append(item)
+
+    def _release_waiters(self):
+        with self._lock:
+            waiters, self._flush_waiters = self._flush_waiters, deque()
+        for w in waiters:
+            w.set()
+
+    def _send(self, batch):
+        # Группируем по kind, сохраняя порядок первых появлений
+        grouped = {}
+        for kind, row in batch:
+            grouped.setdefault(kind, []).append(row)
+        t0 = time.perf_counter()
+        for kind, rows in grouped.items():
+            try:
+                self._sink(kind, rows)
+                self._bump("flushed", len(rows))
+            except Exception:
+                log.exception("EventWriter: не удалось записать %d строк(и) в %s", len(rows), kind)
+                self._bump("failed", len(rows))
+        ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            c = self._counters
+            c["batches"] += 1
+            c["flush_ms_last"] = ms
+            c["flush_ms_total"] += ms
+            c["flush_ms_max"] = max(c["flush_ms_max"], ms)
+
+
+class Heartbeat:
+    """
+    Троттлинг last_seen: не чаще одного обновления на сессию за interval секунд.
+
+    touch() ничего не пишет сам — если пора, отдаёт (session_id, ts) в emit
+    (в app.py это EventWriter.submit), и флашер сводит все накопившиеся
+    heartbeat'ы процесса в один bulk UPDATE за тик.
+    """
+
+    def __init__(self, emit, *, interval: float = 30.0):
+        self._emit = emit
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last = {}            # session_id -> monotonic-время последней отправки
+        self._touches = 0
+        self._writes = 0
+
+    def touch(self, session_id: str, ts: str) -> bool:
+        """True — heartbeat поставлен в запись, False — сэкономлен троттлингом."""
+        now = time.monotonic()
+        with self._lock:
+            self._touches += 1
+            if now - self._last.get(session_id, float("-inf")) < self.interval:
+                return False
+            self._last[session_id] = now
+            self._writes += 1
+            if len(self._last) > 10_000:
+                self._prune(now)
+        self._emit(session_id, ts)
+        return True
+
+    def mark(self, session_id: str):
+        """last_seen уже записан другим путём (db.bootstrap) — считаем это отправленным heartbeat'ом."""
+        with self._lock:
+            self._last[session_id] = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "touches": self._touches,
+                "writes": self._writes,
+                "saved": self._touches - self._writes,
+                "sessions": len(self._last),
+            }
+
+    def _prune(self, now: float):
+        # Сессии, от которых давно ничего не было, больше не нужны для троттлинга
+        horizon = now - 10 * self.interval
+        self._last = {sid: t for sid, t in self._last.items() if t >= horizon}
@@ -0,0 +1,65 @@
+# test_abstats.py — критерии abstats против scipy.stats и ресемплинг в пуле процессов
+#
+#   python -m pytest -q tests/test_abstats.py
+
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from scipy import stats
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import abstats  # noqa: E402
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_welch_ttest_matches_scipy(seed):
+    rng = np.random.default_rng(seed)
+    a = rng.normal(10, 2, size=300)
+    b = rng.normal(10.4, 3, size=450)
+    t, dof, p = abstats.welch_ttest(a, b)
+    ref = stats.ttest_ind(b, a, equal_var=False)
+    assert t == pytest.approx(ref.statistic, rel=1e-10)
+    assert p == pytest.approx(ref.pvalue, rel=1e-8)
+    assert dof == pytest.approx(ref.df, rel=1e-10)
+
+
+@pytest.mark.parametrize("n_a, n_b, expected", [(5000, 5000, (0.5, 0.5)), (5120, 4880, (0.5, 0.5)),
+                                                (3100, 6900, (0.3, 0.7))])
+def test_srm_chisq_matches_scipy(n_a, n_b, expected):
+    chi2, p = abstats.srm_chisq(n_a, n_b, expected)
+    n = n_a + n_b
+    ref = stats.chisquare([n_a, n_b], f_exp=[expected[0] * n, expected[1] * n])
+    assert chi2 == pytest.approx(ref.statistic, rel=1e-10, abs=1e-12)
+    assert p == pytest.approx(ref.pvalue, rel=1e-8)
+
+
+@pytest.mark.parametrize("x_a, n_a, x_b, n_b", [(120, 1000, 150, 1000), (40, 2000, 38, 1800), (0, 10, 0, 10)])
+def test_two_proportion_ztest_matches_scipy(x_a, n_a, x_b, n_b):
+    z, p = abstats.two_proportion_ztest(x_a, n_a, x_b, n_b)
+    # Пулированный z-тест двух долей ≡ χ² 2×2 без поправки Йейтса: z² = χ², p совпадают
+    table = np.array([[x_a, n_a - x_a], [x_b, n_b - x_b]])
+    if x_a + x_b == 0:
+        assert (z, p) == (0.0, 1.0)
+        return
+    chi2, ref_p, _, _ = stats.chi2_contingency(table, correction=False)
+    assert z * z == pytest.approx(chi2, rel=1e-10)
+    assert p == pytest.approx(ref_p, rel=1e-8)
+    assert math.copysign(1, z) == math.copysign(1, x_b / n_b - x_a / n_a)
+
+
+def test_process_pool_matches_inline():
+    rng = np.random.default_rng(7)
+    a = np.where(rng.random(4000) < 0.05, rng.gamma(2, 300, 4000), 0.0)
+    b = np.where(rng.random(4000) < 0.06, rng.gamma(2, 300, 4000), 0.0)
+    old = abstats.MAX_CELLS
+    abstats.MAX_CELLS = 1 << 12                       # несколько порций, чтобы пул действительно включился
+    try:
+        inline = abstats.bootstrap_diff_ci(a, b, n_resamples=400, workers=1, seed=3)
+        pooled = abstats.bootstrap_diff_ci(a, b, n_resamples=400, workers=2, seed=3)
+    finally:
+        abstats.MAX_CELLS = old
+    assert pooled == inline                           # те же seed'ы порций — тот же результат
@@ -0,0 +1,124 @@
+# test_compaction.py — свёртка events -> events_daily (SQLiteStorage) и склейка с SiteAnalytics
+#
+#   python -m pytest -q tests/test_compaction.py
+
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "scripts"))
+
+from compact_events import compact  # noqa: E402
+from site_analytics import SiteAnalytics  # noqa: E402
+from storage import COMPACTION_BUSY, SQLiteStorage  # noqa: E402
+
+DAYS = 8
+
+
+def _day(n: int, hour: int = 12) -> datetime:
+    return (datetime.now(timezone.utc) - timedelta(days=n)).replace(hour=hour, minute=0, second=0, microsecond=0)
+
+
+def _seed(db: SQLiteStorage):
+    """Каждый день: 3 посетителя с page_view на двух страницах, клики по CTA, сессии разной длины."""
+    events, sessions = [], []
+    for d in range(1, DAYS + 1):
+        for v in range(3):
+            sid = f"s{d}-{v}"
+            ts = _day(d).isoformat()
+            sessions.append({"visitor_id": f"v{v}", "session_id": sid})
+            events += [{"created_at": ts, "visitor_id": f"v{v}", "session_id": sid, "page": p,
+                        "event_type": "page_view"} for p in ("Главная", "Контакты")]
+            events.append({"created_at": ts, "visitor_id": f"v{v}", "session_id": sid, "page": "Главная",
+                           "event_type": ("tg_click", "gh_click", "resume_click")[(d + v) % 3]})
+    db.insert_events(events)
+    db.upsert_sessions(sessions)
+    db.touch_sessions([{"session_id": s["session_id"], "last_seen": _day(int(s["session_id"][1:].split("-")[0]), 13)
+                        .isoformat()} for s in sessions])
+
+
+def _tables(db: SQLiteStorage) -> tuple:
+    return (db._query("SELECT day, page, event_type, n FROM events_daily ORDER BY 1, 2, 3"),
+            db._query("SELECT day, visitor_id FROM daily_visitors ORDER BY 1, 2"))
+
+
+def _charts(an: SiteAnalytics) -> dict:
+    return {"dau": an.dau().to_dict("list"), "views": an.page_views().to_dict(),
+            "cta": an.cta().to_dict(), "lengths": an.session_lengths().to_dict()}
+
+
+def _compact(db: SQLiteStorage, days_back: int) -> str:
+    before = _day(days_back).date().isoformat()
+    assert compact(db, before, chunk=7, pause=0)["status"] == "done"
+    return before
+
+
+def test_compact_twice_is_idempotent():
+    db = SQLiteStorage(":memory:")
+    _seed(db)
+    before = _compact(db, 4)
+    first = _tables(db)
+    assert first[0] and first[1]
+    # Повтор: переносить нечего, агрегаты не меняются (в т.ч. __visitors__)
+    assert db.compact_events(before, 7) == 0
+    assert _compact(db, 4) == before
+    assert _tables(db) == first
+    assert db.compaction_horizon() == before
+
+
+def test_finish_compaction_refuses_while_rows_remain():
+    db = SQLiteStorage(":memory:")
+    _seed(db)
+    before = _day(4).date().isoformat()
+    assert db.compact_events(before, 1) == 1          # перенесена одна строка из многих
+    assert db.finish_compaction(before) is False
+    assert db.compaction_horizon() is None
+
+
+def test_busy_lock_is_not_done():
+    class Busy:
+        finished = False
+
+        def compact_events(self, before, limit):
+            return COMPACTION_BUSY
+
+        def finish_compaction(self, before):
+            self.finished = True
+            return True
+
+    storage = Busy()
+    out = compact(storage, "2026-01-01", chunk=10, pause=0)
+    assert out["status"] == "busy" and not storage.finished
+
+
+def test_incomplete_when_rows_stay_locked():
+    class Stuck:
+        def compact_events(self, before, limit):
+            return 0                                   # skip locked пропустил всё
+
+        def finish_compaction(self, before):
+            return False
+
+    assert compact(Stuck(), "2026-01-01", chunk=10, pause=0, retries=2)["status"] == "incomplete"
+
+
+def test_charts_unchanged_across_compaction_in_live_process():
+    db = SQLiteStorage(":memory:")
+    _seed(db)
+    an = SiteAnalytics(db, min_interval=0, settle_days=2)
+    an.refresh(True)
+    before = _charts(an)
+
+    _compact(db, 5)
+    an.refresh(True)
+    assert _charts(an) == before
+
+    _compact(db, 2)                                    # горизонт сдвигается ещё раз
+    an.refresh(True)
+    assert _charts(an) == before
+
+    fresh = SiteAnalytics(db, min_interval=0, settle_days=2)
+    fresh.refresh(True)
+    assert _charts(fresh) == before
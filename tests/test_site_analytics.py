@@ -0,0 +1,51 @@
+# test_site_analytics.py — SiteAnalytics на SQLiteStorage: свёртка горизонта в живом процессе
+#
+#   python -m pytest -q tests/test_site_analytics.py
+
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from site_analytics import SiteAnalytics  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+DAYS = 10
+VISITORS = 3
+
+
+def _day(n: int) -> datetime:
+    """Полдень UTC n дней назад."""
+    return (datetime.now(timezone.utc) - timedelta(days=n)).replace(hour=12, minute=0, second=0, microsecond=0)
+
+
+def _seed(db: SQLiteStorage):
+    db.insert_events([
+        {"created_at": _day(d).isoformat(), "visitor_id": f"v{v}", "session_id": f"s{d}-{v}",
+         "page": "Главная", "event_type": "page_view"}
+        for d in range(1, DAYS + 1) for v in range(VISITORS)
+    ])
+
+
+def test_dau_not_double_counted_after_horizon_moves():
+    db = SQLiteStorage(":memory:")
+    _seed(db)
+    an = SiteAnalytics(db, min_interval=0, settle_days=2)
+    an.refresh(True)
+    assert (an.dau()["visitors"] == VISITORS).all()
+
+    # Ночная свёртка, пока процесс живёт: дни старше 5 суток уходят в events_daily
+    before = _day(5).date().isoformat()
+    while db.compact_events(before, 1000) > 0:
+        pass
+    assert db.finish_compaction(before)
+    an.refresh(True)
+
+    dau = an.dau()
+    assert len(dau) == DAYS
+    assert (dau["visitors"] == VISITORS).all()
+    # Новый процесс на той же базе видит то же самое
+    fresh = SiteAnalytics(db, min_interval=0, settle_days=2)
+    fresh.refresh(True)
+    assert fresh.dau()["visitors"].tolist() == dau["visitors"].tolist()
@@ -0,0 +1,122 @@
+# test_spool.py — Spool: плохие строки в dead, транзиентные ошибки с backoff, повтор без задвоения
+#
+#   python -m pytest -q tests/test_spool.py
+
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from spool import Spool, is_permanent  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+
+class FakeSink:
+    """Принимает пачки (kind, rows); строки с bad=True отвергает «навсегда», пока down — «сеть лежит»."""
+
+    def __init__(self):
+        self.rows = []
+        self.calls = 0
+        self.down = False
+        self._lock = threading.Lock()
+
+    def __call__(self, kind, rows):
+        with self._lock:
+            self.calls += 1
+            if self.down:
+                raise ConnectionError("backend недоступен")
+            if any(r.get("bad") for r in rows):
+                raise ValueError("строка не проходит проверку")
+            self.rows.extend(r["i"] for r in rows)
+
+
+def _spool(path, sink, **kw):
+    kw = {"idle_interval": 0.02, "base_backoff": 0.02, "max_backoff": 0.05, **kw}
+    return Spool(path, sink, **kw)
+
+
+def _wait(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _dead(path) -> list:
+    with sqlite3.connect(str(path)) as db:
+        return [row[0] for row in db.execute("SELECT payload FROM dead")]
+
+
+def test_permanent_error_buries_only_the_bad_row(tmp_path):
+    sink = FakeSink()
+    sp = _spool(tmp_path / "spool.db", sink)
+    try:
+        for i in range(6):
+            sp.submit("events", {"i": i, "bad": i == 2})
+        assert sp.flush(timeout=5.0)
+        assert sink.rows == [0, 1, 3, 4, 5]          # остальные доставлены, порядок сохранён
+        s = sp.stats()
+        assert s["dead"] == 1 and s["queue_depth"] == 0
+    finally:
+        sp.close()
+    dead = _dead(tmp_path / "spool.db")
+    assert len(dead) == 1 and '"i": 2' in dead[0]
+
+
+def test_transient_error_keeps_rows_and_backs_off(tmp_path):
+    sink = FakeSink()
+    sink.down = True
+    sp = _spool(tmp_path / "spool.db", sink)
+    try:
+        for i in range(5):
+            sp.submit("events", {"i": i})
+        assert _wait(lambda: sink.calls >= 3)
+        s = sp.stats()
+        assert s["queue_depth"] == 5 and s["dead"] == 0   # всё ещё в журнале
+        assert s["failed"] >= 5 and s["backoff_s"] > 0
+        sink.down = False
+        assert sp.flush(timeout=5.0)
+        assert sink.rows == list(range(5))
+        assert sp.stats()["queue_depth"] == 0
+    finally:
+        sp.close()
+
+
+def test_replay_after_lost_response_does_not_double_count(tmp_path):
+    db = SQLiteStorage(":memory:")
+    lost = {"n": 0}
+
+    def sink(kind, rows):
+        db.write_batch(kind, rows)
+        if lost["n"] == 0:                            # записали, но ответ «потерялся»
+            lost["n"] += 1
+            raise ConnectionError("timeout после записи")
+
+    sp = _spool(tmp_path / "spool.db", sink)
+    try:
+        for sec in (10, 5, 7):
+            sp.submit("durations", {"session_id": "s1", "page": "Главная", "seconds": sec})
+        assert _wait(lambda: sp.stats()["queue_depth"] == 0 and lost["n"] == 1)
+    finally:
+        sp.close()
+    assert db.page_durations() == {"Главная": 22}
+
+
+def test_is_permanent_classification():
+    class PgError(Exception):
+        def __init__(self, code):
+            self.code = code
+
+    class HttpError(Exception):
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+    assert is_permanent(PgError("23505")) and is_permanent(PgError("22P02")) and is_permanent(PgError("PGRST204"))
+    assert is_permanent(HttpError(400)) and is_permanent(ValueError())
+    assert not is_permanent(HttpError(429)) and not is_permanent(HttpError(503))
+    assert not is_permanent(ConnectionError()) and not is_permanent(PgError("57014"))
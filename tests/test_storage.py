@@ -0,0 +1,118 @@
+# test_storage.py — идемпотентность add_durations при повторе пачки из журнала
+#
+#   python -m pytest -q tests/test_storage.py
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from storage import SQLiteStorage, SupabaseStorage  # noqa: E402
+
+
+def _rows():
+    return [{"session_id": "s1", "page": "Главная", "seconds": 10, "op_key": "k1"},
+            {"session_id": "s1", "page": "Контакты", "seconds": 5, "op_key": "k2"},
+            {"session_id": "s1", "page": "Главная", "seconds": 7, "op_key": "k3"}]
+
+
+def test_sqlite_replayed_batch_is_not_double_counted():
+    db = SQLiteStorage(":memory:")
+    db.write_batch("durations", _rows())
+    db.write_batch("durations", _rows())           # повтор той же пачки из журнала
+    assert db.page_durations() == {"Главная": 17, "Контакты": 5}
+
+
+# --- Supabase: фейковый PostgREST, RPC add_durations не задеплоена ---
+class _APIError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, sb, table):
+        self.sb, self.table, self.filters, self.op, self.payload = sb, table, {}, "select", None
+
+    def select(self, _cols):
+        return self
+
+    def eq(self, k, v):
+        self.filters[k] = v
+        return self
+
+    def limit(self, _n):
+        return self
+
+    def update(self, payload):
+        self.op, self.payload = "update", payload
+        return self
+
+    def insert(self, payload):
+        self.op, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, **_):
+        self.op, self.payload = "upsert", payload
+        return self
+
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    def execute(self):
+        self.sb.calls += 1
+        if self.sb.fail_at == self.sb.calls:
+            raise ConnectionError("обрыв посреди пачки")
+        rows = self.sb.tables.setdefault(self.table, [])
+        match = [r for r in rows if all(r.get(k) == v for k, v in self.filters.items())]
+        if self.op == "select":
+            return _Result([dict(r) for r in match])
+        if self.op == "update":
+            for r in match:
+                r.update(self.payload)
+            return _Result(match)
+        if self.op == "delete":
+            self.sb.tables[self.table] = [r for r in rows if r not in match]
+            return _Result(match)
+        if self.op == "upsert" and any(r["op_key"] == self.payload["op_key"] for r in rows):
+            return _Result([])                      # ignore_duplicates: уже есть — пустой ответ
+        rows.append(dict(self.payload))
+        return _Result([self.payload])
+
+
+class _FakeSupabase:
+    def __init__(self):
+        self.tables, self.calls, self.fail_at = {}, 0, None
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params):
+        raise _APIError("PGRST202")
+
+
+def _seconds(sb) -> dict:
+    return {r["page"]: r["seconds"] for r in sb.tables.get("durations", [])}
+
+
+# Вызовы на строку: upsert applied_ops, select durations, insert/update durations.
+# Обрыв на 6-м — запись durations второй строки: первая уже применена, третья не начата
+@pytest.mark.parametrize("fail_at", [4, 5, 6, 7])
+def test_supabase_fallback_retry_after_partial_failure(fail_at):
+    sb = _FakeSupabase()
+    store = SupabaseStorage(sb)
+    sb.fail_at = fail_at
+    with pytest.raises(ConnectionError):
+        store.add_durations(_rows())
+    sb.fail_at = None
+    store.add_durations(_rows())                    # журнал повторяет всю пачку
+    store.add_durations(_rows())                    # и ещё раз — ничего не меняется
+    assert _seconds(sb) == {"Главная": 17, "Контакты": 5}
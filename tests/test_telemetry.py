@@ -0,0 +1,89 @@
+# test_telemetry.py — EventWriter: submit не ждёт sink, flush/close досылают, при переполнении — drop
+#
+#   python -m pytest -q tests/test_telemetry.py
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry import EventWriter  # noqa: E402
+
+SINK_LATENCY = 0.2
+
+
+class SlowSink:
+    """Фейковый бэкенд: каждая пачка «едет» SINK_LATENCY секунд; всё полученное — в rows."""
+
+    def __init__(self, latency: float = SINK_LATENCY):
+        self.latency = latency
+        self.rows = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, kind: str, rows: list):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            self.rows.extend((kind, r) for r in rows)
+
+
+def test_submit_does_not_wait_for_sink():
+    sink = SlowSink()
+    w = EventWriter(sink, batch_size=10, flush_interval=0.05)
+    try:
+        t0 = time.perf_counter()
+        for i in range(100):
+            assert w.submit("events", {"i": i})
+        elapsed = time.perf_counter() - t0
+        # 100 строк = 10 пачек по SINK_LATENCY; submit не должен ждать ни одной
+        assert elapsed < SINK_LATENCY / 4
+    finally:
+        w.close()
+
+
+def test_flush_delivers_queued_rows_in_order():
+    sink = SlowSink(latency=0.01)
+    w = EventWriter(sink, batch_size=1000, flush_interval=60.0)
+    try:
+        for i in range(25):
+            w.submit("events", {"i": i})
+        w.submit("votes", {"choice": "like"})
+        assert w.flush(timeout=5.0)
+        assert [r["i"] for k, r in sink.rows if k == "events"] == list(range(25))
+        assert ("votes", {"choice": "like"}) in sink.rows
+        s = w.stats()
+        assert s["flushed"] == 26 and s["queue_depth"] == 0
+    finally:
+        w.close()
+
+
+def test_close_delivers_tail_and_rejects_new_rows():
+    sink = SlowSink(latency=0.01)
+    w = EventWriter(sink, batch_size=1000, flush_interval=60.0)
+    for i in range(10):
+        w.submit("events", {"i": i})
+    w.close(timeout=5.0)
+    assert [r["i"] for _, r in sink.rows] == list(range(10))
+    assert not w.submit("events", {"i": 10})
+
+
+def test_drops_under_backpressure():
+    gate = threading.Event()
+
+    def stuck_sink(kind, rows):
+        gate.wait(5.0)              # бэкенд «висит», флашер не разбирает очередь
+
+    w = EventWriter(stuck_sink, batch_size=1, flush_interval=0.01, max_queue=5, put_timeout=0.01)
+    try:
+        results = [w.submit("events", {"i": i}) for i in range(50)]
+        s = w.stats()
+        # В очередь влезает max_queue (+1 строка уже у флашера), остальное отброшено, не заблокировав вызывающего
+        assert results.count(False) == s["dropped"] > 0
+        assert s["submitted"] + s["dropped"] == 50
+        assert s["submitted"] <= 5 + 1
+    finally:
+        gate.set()
+        w.close()
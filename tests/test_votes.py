@@ -0,0 +1,57 @@
+# test_votes.py — VoteTally: TTL-кэш и устаревшие счётчики при сбое backend
+#
+#   python -m pytest -q tests/test_votes.py
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from votes import VoteTally  # noqa: E402
+
+
+class FlakyFetch:
+    def __init__(self):
+        self.calls = 0
+        self.down = False
+        self.counts = {"like": 3, "dislike": 1}
+
+    def __call__(self):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("backend недоступен")
+        return self.counts
+
+
+def test_stale_counts_when_fetch_fails():
+    fetch = FlakyFetch()
+    tally = VoteTally(fetch, ttl=0)
+    assert tally.counts() == (3, 1)
+    fetch.down = True
+    assert tally.counts() == (3, 1)                 # прошлое значение вместо исключения
+    assert tally.stats()["stale"] == 1
+    fetch.down, fetch.counts = False, {"like": 4, "dislike": 1}
+    assert tally.counts() == (4, 1)
+
+
+def test_failed_refresh_waits_ttl_before_retry():
+    fetch = FlakyFetch()
+    tally = VoteTally(fetch, ttl=60)
+    tally.counts()
+    tally.invalidate()
+    fetch.down = True
+    for _ in range(5):
+        assert tally.counts() == (3, 1)
+    assert fetch.calls == 2                         # лежащий backend спросили один раз
+
+
+def test_no_previous_value_raises():
+    fetch = FlakyFetch()
+    fetch.down = True
+    tally = VoteTally(fetch, ttl=60)
+    with pytest.raises(ConnectionError):
+        tally.counts()
+    fetch.down = False
+    assert tally.counts() == (3, 1)                 # после ошибки _refreshing сброшен
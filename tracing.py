@@ -0,0 +1,172 @@
+# tracing.py — лёгкие тайминг-спаны: гистограммы на процесс + экспорт в Chrome Trace Event JSON
+
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Верхние границы корзин гистограммы, мс
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("_tracer", "_name", "_t0")
+
+    def __init__(self, tracer, name):
+        self._tracer, self._name = tracer, name
+
+    def __enter__(self):
+        self._t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self._tracer._record(self._name, self._t0, time.perf_counter_ns())
+        return False
+
+
+class Histogram:
+    __slots__ = ("counts", "n", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.n = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.n += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def quantile(self, q: float) -> float:
+        """Оценка сверху: граница корзины, в которую попал q-квантиль (последняя — max)."""
+        rank, seen = q * self.n, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= rank:
+                return min(BUCKETS_MS[i], self.max_ms)
+        return self.max_ms
+
+
+class Tracer:
+    """
+    Спаны по имени: `with tracer.span("db.vote_counts"): ...`, декоратор traced(),
+    или пара start()/finish() для участков, которые нельзя обернуть в with.
+
+    Выключенный трейсер отдаёт общий no-op объект — цена вызова на горячем пути
+    сводится к проверке флага. Включённый пишет длительность в гистограмму имени
+    и событие в кольцевой буфер (max_events) для экспорта.
+    """
+
+    def __init__(self, enabled: bool = False, *, max_events: int = 50_000):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._hist = {}
+        self._events = deque(maxlen=max_events)
+        self._pid = os.getpid()
+        self._epoch_ns = time.perf_counter_ns()
+
+    # --- запись ---
+    def span(self, name: str):
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, name)
+
+    def start(self, name: str):
+        return (name, time.perf_counter_ns()) if self.enabled else None
+
+    def finish(self, token):
+        if token is not None:
+            self._record(token[0], token[1], time.perf_counter_ns())
+
+    def traced(self, name: str = None):
+        def deco(fn):
+            span_name = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Span(self, span_name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return deco
+
+    def wrap(self, obj, prefix: str):
+        """Прокси: каждый публичный метод obj — спан «prefix.method»."""
+        return _TracedProxy(self, obj, prefix) if self.enabled else obj
+
+    def _record(self, name: str, t0: int, t1: int):
+        ms = (t1 - t0) / 1e6
+        ev = {"name": name, "ph": "X", "pid": self._pid, "tid": threading.get_ident(),
+              "ts": (t0 - self._epoch_ns) / 1000, "dur": (t1 - t0) / 1000}
+        with self._lock:
+            h = self._hist.get(name)
+            if h is None:
+                h = self._hist[name] = Histogram()
+            h.add(ms)
+            self._events.append(ev)
+
+    # --- чтение / экспорт ---
+    def summary(self) -> list:
+        with self._lock:
+            items = list(self._hist.items())
+        return sorted((
+            {"span": name, "count": h.n, "total_ms": round(h.total_ms, 2),
+             "avg_ms": round(h.total_ms / h.n, 3), "p50_ms": h.quantile(0.5),
+             "p95_ms": h.quantile(0.95), "p99_ms": h.quantile(0.99), "max_ms": round(h.max_ms, 3)}
+            for name, h in items
+        ), key=lambda r: -r["total_ms"])
+
+    def export_json(self) -> str:
+        """Chrome Trace Event Format: открывается в Perfetto / chrome://tracing."""
+        with self._lock:
+            events = list(self._events)
+        return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, ensure_ascii=False)
+
+    def export(self, path) -> int:
+        data = self.export_json()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data)
+        return len(data)
+
+    def reset(self):
+        with self._lock:
+            self._hist.clear()
+            self._events.clear()
+
+
+class _TracedProxy:
+    def __init__(self, tracer, obj, prefix):
+        self._tracer, self._obj, self._prefix = tracer, obj, prefix
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        span_name = f"{self._prefix}.{name}"
+        tracer = self._tracer
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            with tracer.span(span_name):
+                return attr(*args, **kwargs)
+        return call
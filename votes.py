@@ -0,0 +1,74 @@
+# votes.py — общий на процесс кэш счётчиков лайков/дизлайков
+
+import threading
+import time
+
+
+class VoteTally:
+    """
+    Счётчики голосов с TTL, общие для всех сессий процесса.
+
+    fetch() -> {"like": n, "dislike": m} вызывается не чаще раза в ttl секунд
+    (и только одним потоком, остальные получают текущее значение). Успешный
+    голос сразу учитывается через bump(), без повторного запроса.
+    Если fetch() падает, а прошлое значение есть, — отдаём его (устаревшее)
+    и повторяем запрос не раньше чем через ttl; без прошлого значения — ошибка.
+    """
+
+    def __init__(self, fetch, *, ttl: float = 60.0):
+        self._fetch = fetch
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._counts = None
+        self._fetched_at = float("-inf")
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+
+    def counts(self) -> tuple:
+        with self._lock:
+            fresh = time.monotonic() - self._fetched_at < self.ttl
+            if self._counts is not None and (fresh or self._refreshing):
+                self._hits += 1
+                return self._pair()
+            self._misses += 1
+            self._refreshing = True
+        try:
+            fetched = self._fetch()
+        except Exception:
+            with self._lock:
+                if self._counts is None:
+                    raise
+                self._stale += 1
+                self._fetched_at = time.monotonic()   # не долбим лежащий backend на каждом rerun
+                return self._pair()
+        finally:
+            with self._lock:
+                self._refreshing = False
+        with self._lock:
+            self._counts = dict(fetched)
+            self._fetched_at = time.monotonic()
+            return self._pair()
+
+    def seed(self, counts: dict):
+        """Свежие счётчики, пришедшие попутно (db.bootstrap), — как результат fetch()."""
+        with self._lock:
+            self._counts = dict(counts)
+            self._fetched_at = time.monotonic()
+
+    def bump(self, choice: str, n: int = 1):
+        with self._lock:
+            if self._counts is not None:
+                self._counts[choice] = self._counts.get(choice, 0) + n
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = float("-inf")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "stale": self._stale, "ttl": self.ttl}
+
+    def _pair(self) -> tuple:
+        return self._counts.get("like", 0), self._counts.get("dislike", 0)